@@ -0,0 +1,246 @@
+"""Scripted stress benchmarks for Strawberry Shooter.
+
+Each scenario drives a GameWorld under the SDL dummy drivers, draws every
+frame to the (invisible) screen and reports frames/sec, per-phase timings
+from the frame profiler and peak Python memory from tracemalloc.
+
+    python benchmarks/run_benchmarks.py                  # run and compare with baseline.json
+    python benchmarks/run_benchmarks.py --save-baseline  # store results as the new baseline
+    python benchmarks/run_benchmarks.py --only bomb --frames 1000
+    python benchmarks/run_benchmarks.py --collision both  # rect vs pixel-mask hit tests
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import shooter_game as game
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+NO_INPUT = game.FrameInput()
+
+def make_invulnerable(world):
+    player = world.player
+    player.shield_active = True
+    player.shield_duration = 10 ** 9
+
+def top_up_enemies(world, count):
+    rng = world.rng
+    for _ in range(count - len(world.enemy_group)):
+        enemy = game.enemy_pool.acquire((), world.score, rng)
+        enemy.rect.center = (rng.randint(20, game.WIDTH - 20), rng.randint(20, game.HEIGHT - 150))
+        enemy.add(world.enemy_group)
+
+def fire_bullet(world, x, y):
+    game.bullet_pool.acquire((world.player_bullet_group,), x, y, 0, -10)
+
+# ========== SCENARIOS ==========
+# Each scenario is (setup(world), frame(world) -> FrameInput)
+
+def collisions_setup(world, enemies=200, bullets=200):
+    make_invulnerable(world)
+    world.n_enemies = enemies
+    world.n_bullets = bullets
+
+def collisions_frame(world):
+    """N enemies x M bullets spread over the screen, topped up every frame."""
+    top_up_enemies(world, world.n_enemies)
+    rng = world.rng
+    for _ in range(world.n_bullets - len(world.player_bullet_group)):
+        fire_bullet(world, rng.randint(0, game.WIDTH), rng.randint(100, game.HEIGHT))
+    return NO_INPUT
+
+def bomb_setup(world):
+    make_invulnerable(world)
+
+def bomb_frame(world):
+    """A full wave of enemies bombed every frame through Player.use_bomb."""
+    top_up_enemies(world, 60)
+    world.player.bombs = 1
+    return game.FrameInput(bomb=True)
+
+def boss_setup(world):
+    make_invulnerable(world)
+    world.score = world.next_boss_score = 10 ** 9  # no regular boss spawns
+    boss = game.Boss(health=10 ** 9)
+    world.boss_group.add(boss)
+    world.has_boss = True
+
+def boss_frame(world):
+    """A stream of bullets hitting the boss, each hit spawning particles."""
+    boss = world.boss_group.sprite
+    for _ in range(20):
+        fire_bullet(world, boss.rect.centerx + world.rng.randint(-20, 20), boss.rect.bottom + 5)
+    return NO_INPUT
+
+def combo_setup(world):
+    make_invulnerable(world)
+
+def combo_frame(world):
+    """Enemies spawned straight onto bullets: kill text, combo text and a busy HUD every frame."""
+    rng = world.rng
+    for _ in range(10):
+        x, y = rng.randint(40, game.WIDTH - 40), rng.randint(200, game.HEIGHT - 150)
+        enemy = game.enemy_pool.acquire((), world.score, rng)
+        enemy.rect.center = (x, y)
+        enemy.add(world.enemy_group)
+        fire_bullet(world, x, y + 10)
+    return NO_INPUT
+
+def swarm_setup(world):
+    make_invulnerable(world)
+    world.player.rect.x = 0
+
+def swarm_frame(world):
+    """A wave of thousands: enemies falling down the left half, bullets rising up the right half."""
+    rng = world.rng
+    for _ in range(2000 - len(world.enemy_group)):
+        enemy = game.enemy_pool.acquire((), world.score, rng)
+        enemy.rect.center = (rng.randint(20, game.WIDTH // 2 - 40), rng.randint(-100, game.HEIGHT - 150))
+        enemy.add(world.enemy_group)
+    for _ in range(1000 - len(world.player_bullet_group)):
+        fire_bullet(world, rng.randint(game.WIDTH // 2 + 40, game.WIDTH), rng.randint(0, game.HEIGHT))
+    return NO_INPUT
+
+def bullet_hell_setup(world):
+    boss_setup(world)
+    world.player.rect.midbottom = (game.WIDTH // 2, game.HEIGHT - 10)
+
+def bullet_hell_frame(world):
+    """The boss's patterns plus extra rings from the sides: thousands of enemy bullets on screen."""
+    rng = world.rng
+    if world.frame % 4 == 0:
+        ring = game.Emitter(count=48, spread=360)
+        for x in (100, game.WIDTH - 100):
+            angles = game.emitter_angles(ring, rng.uniform(0, 360))
+            world.enemy_bullets.fire((x, 150), angles, rng.uniform(0.5, 1.5))
+    return NO_INPUT
+
+SCENARIOS = {
+    "collisions": (collisions_setup, collisions_frame),
+    "bomb": (bomb_setup, bomb_frame),
+    "boss": (boss_setup, boss_frame),
+    "combo": (combo_setup, combo_frame),
+    "swarm": (swarm_setup, swarm_frame),
+    "bullet_hell": (bullet_hell_setup, bullet_hell_frame),
+}
+
+# ========== RUNNER ==========
+def run_frames(world, frame, frames, surface):
+    for _ in range(frames):
+        inputs = frame(world)  # scenario scripting is not part of the measured frame
+        game.profiler.begin_frame()
+        world.step(inputs)
+        world.draw(surface)
+        game.profiler.end_frame(world.sprite_counts)
+
+def run_scenario(name, frames, warmup=30, seed=1, collision="rect"):
+    setup, frame = SCENARIOS[name]
+    surface = game.init_display()
+
+    # Timing pass
+    game.profiler = game.FrameProfiler(window=frames)
+    game.profiler.enable()
+    world = game.GameWorld(seed=seed, collision=collision)
+    setup(world)
+    run_frames(world, frame, warmup, surface)
+    game.profiler = game.FrameProfiler(window=frames)
+    game.profiler.enable()
+    start = time.perf_counter()
+    run_frames(world, frame, frames, surface)
+    elapsed = time.perf_counter() - start
+    summary = game.profiler.summary()
+
+    # Memory pass (tracemalloc slows everything down, so it is not timed)
+    game.profiler = game.FrameProfiler()
+    world = game.GameWorld(seed=seed, collision=collision)
+    setup(world)
+    tracemalloc.start()
+    run_frames(world, frame, warmup + frames, surface)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "fps": frames / elapsed,
+        "phases_ms": {phase: {"p50": p50, "p95": p95, "p99": p99}
+                      for phase, (p50, p95, p99) in summary["phases_ms"].items()},
+        "peak_kib": peak / 1024,
+        "sprites": summary["sprites"],
+        "counters": summary["counters"],
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def change(new, old):
+    return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+def report(name, result, baseline):
+    old = baseline.get(name)
+    line = f"{name:<16} {result['fps']:9.1f} fps   peak {result['peak_kib']:9.1f} KiB"
+    if old:
+        line += f"   (fps {change(result['fps'], old['fps'])}, peak {change(result['peak_kib'], old['peak_kib'])})"
+    print(line)
+    for phase, times in result["phases_ms"].items():
+        line = f"    {phase:<15} p50 {times['p50']:7.3f} ms   p95 {times['p95']:7.3f} ms"
+        old_times = old and old["phases_ms"].get(phase)
+        if old_times:
+            line += f"   (p50 {change(times['p50'], old_times['p50'])})"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=300, help="measured frames per scenario")
+    parser.add_argument("--only", choices=sorted(SCENARIOS), action="append", help="run only these scenarios")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--output", help="also write these results to a JSON file")
+    parser.add_argument("--collision", choices=game.COLLISION_MODES + ("both",), default="rect",
+                        help="hit test mode; mask results are stored as '<scenario>@mask'")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        baseline = stored["scenarios"]
+        print(f"Comparing with baseline from {stored['revision']} ({args.baseline})")
+
+    modes = game.COLLISION_MODES if args.collision == "both" else (args.collision,)
+    results = {}
+    for name in args.only or SCENARIOS:
+        for mode in modes:
+            key = name if mode == "rect" else f"{name}@{mode}"
+            results[key] = run_scenario(name, args.frames, collision=mode)
+            report(key, results[key], baseline)
+            if key != name and name in results:
+                collisions = [result["phases_ms"]["collisions"]["p50"] for result in (results[key], results[name])]
+                print(f"    {mode} vs rect: fps {change(results[key]['fps'], results[name]['fps'])}, "
+                      f"collisions p50 {change(*collisions)}")
+
+    data = {"revision": git_revision(), "frames": args.frames, "scenarios": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(data, f, indent=2)
+    if args.save_baseline:
+        if baseline:
+            data["scenarios"] = {**baseline, **results}
+        with open(args.baseline, "w") as f:
+            json.dump(data, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+if __name__ == "__main__":
+    main()
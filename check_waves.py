@@ -0,0 +1,90 @@
+"""Validate a Strawberry Shooter wave file and estimate its on-screen load.
+
+Loads the file exactly as the game does (so every schema error is reported
+with the entry it is in), then for each wave estimates how many enemies are
+alive at once if the player shoots none of them: each loop of the wave is
+replayed back to back and every enemy lives until it falls off the bottom of
+the screen.
+
+    python check_waves.py waves.json --budget 60
+
+Two estimates are printed per wave: "typical" with every enemy at the mean of
+its archetype's speed range, which is flagged against --budget, and "worst"
+with all of them at the slowest speed. The exit status is 1 when the file is
+invalid or a wave is over budget.
+"""
+import os
+import sys
+import argparse
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import shooter_game as game
+
+game.DEBUG = False
+
+def lifetimes(event, enemy_height, balance, score):
+    """Frames each of the event's enemies stays alive, as (typical, worst) lists."""
+    speed_min, speed_max = game.speed_range(event.archetype, balance, score)
+    # Rough spawn heights; random x does not matter here, so a fixed centre is fine
+    spawn_ys = [0 if pos is None else pos[1]
+                for pos in game.formation_positions(event._replace(x=game.WIDTH // 2))]
+    typical, worst = [], []
+    for y in spawn_ys:
+        travel = game.HEIGHT + enemy_height - y
+        typical.append(int(travel / ((speed_min + speed_max) / 2)) + 1)
+        worst.append(int(travel / max(speed_min, 1e-6)) + 1)
+    return typical, worst
+
+def peak_alive(spans):
+    """Most (start, end) spans open at once."""
+    changes = sorted([(start, 1) for start, _ in spans] + [(end, -1) for _, end in spans])
+    alive = peak = 0
+    for _, change in changes:
+        alive += change
+        peak = max(peak, alive)
+    return peak
+
+def estimate(wave, enemy_height, balance, score):
+    """(typical, worst) peak alive enemies with the wave looping until it reaches a steady state."""
+    per_event = [(event, lifetimes(event, enemy_height, balance, score)) for event in wave.events]
+    longest = max((max(worst) for _, (_, worst) in per_event), default=0)
+    loops = int(longest / wave.length) + 2
+    peaks = []
+    for pick in (0, 1):
+        spans = [(loop * wave.length + event.at, loop * wave.length + event.at + life)
+                 for loop in range(loops) for event, lives in per_event for life in lives[pick]]
+        peaks.append(peak_alive(spans))
+    return tuple(peaks)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="wave file (.json or .toml)")
+    parser.add_argument("--budget", type=int, default=60, help="most enemies allowed on screen at once (typical estimate)")
+    parser.add_argument("--score", type=int, default=0, help="score used for score-scaled enemy speeds")
+    args = parser.parse_args()
+
+    try:
+        schedule = game.load_waves(args.path)
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+
+    balance = game.DEFAULT_BALANCE
+    enemy_height = game.atlas.image("enemy").get_height()
+    over = False
+    print(f"{args.path}: {len(schedule.waves)} waves, {sum(e.count for e in schedule.intro)} intro enemies")
+    for i, wave in enumerate(schedule.waves):
+        last = schedule.waves[i + 1].level - 1 if i + 1 < len(schedule.waves) else None
+        levels = f"level {wave.level}+" if last is None else f"levels {wave.level}-{last}"
+        enemies = sum(event.count for event in wave.events)
+        typical, worst = estimate(wave, enemy_height, balance, args.score)
+        flag = "  OVER BUDGET" if typical > args.budget else ""
+        over |= bool(flag)
+        print(f"{levels:<14} loop {wave.length:5.0f} frames, {enemies:3} enemies "
+              f"({enemies / wave.length * 60:4.1f}/s), peak alive typical {typical:3}, worst {worst:3}{flag}")
+    sys.exit(1 if over else 0)
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,53 @@ import sys
 import random
 import os
 import math
+import time
+import argparse
+import atexit
+import csv
+import json
+import struct
+import threading
+import sqlite3
+import bisect
+import heapq
+import itertools
+import hashlib
+import weakref
+from array import array
+from collections import Counter, OrderedDict, deque, namedtuple
+from queue import Full, Queue
 
-# Initialize Pygame
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11: JSON wave files only
+    tomllib = None
+
+# Headless runs and replays need the SDL dummy drivers selected before pygame.init()
+HEADLESS = "--headless" in sys.argv or "--replay" in sys.argv
+if HEADLESS:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+# Initialize Pygame (the window itself is opened by init_display())
 pygame.init()
-pygame.mixer.init()
+try:
+    pygame.mixer.init()
+except pygame.error as e:
+    print(f"Audio unavailable: {e}. Continuing without sound.")
 WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Strawberry Shooter - Birthday Edition")
+screen = None
 clock = pygame.time.Clock()
 
+def init_display():
+    global screen
+    if screen is None:
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption("Strawberry Shooter - Birthday Edition")
+    return screen
+
 # Colors
 WHITE = (255, 255, 255)
 RED   = (255, 0, 0)
@@ -24,14 +62,27 @@ PURPLE = (128, 0, 128)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ASSET_DIR = os.path.join(BASE_DIR, "attached_assets")
 
-# Debug mode
-DEBUG = True
+# Debug mode (too chatty for headless runs)
+DEBUG = not HEADLESS
 
 # Game states
 MENU = 0
 PLAYING = 1
 PAUSE = 2
 
+# Gameplay tuning (simulate.py sweeps these)
+Balance = namedtuple("Balance", [
+    "spawn_interval",            # frames between waves, before the per-level cut
+    "min_spawn_interval",        # fastest wave rate at high levels
+    "spawn_interval_per_level",  # frames taken off the interval per level
+    "enemy_speed_min",
+    "enemy_speed_max",           # upper speed bound at score 0...
+    "enemy_speed_per_score",     # ...raised by this much per point
+    "boss_level_interval",       # score between bosses (plus 100 per level)
+    "powerup_weights",           # shield, triple, bomb
+], defaults=(90, 30, 2, 0.3, 1.0, 0.005, 500, (0.4, 0.4, 0.2)))
+DEFAULT_BALANCE = Balance()
+
 # Placeholder for stars (for menu background)
 stars = [[random.randint(0, WIDTH), random.randint(0, HEIGHT), random.uniform(0.5, 2), random.randint(1, 3), WHITE] for _ in range(50)]
 
@@ -40,138 +91,1159 @@ def scale_image(img, target_width):
     aspect = img.get_height() / img.get_width()
     return pygame.transform.smoothscale(img, (target_width, int(target_width * aspect)))
 
-# Load Happy Birthday Background
-background_path = os.path.join(BASE_DIR, "happy_birthday_background.png")
-if DEBUG:
-    print(f"Attempting to load background from: {background_path}")
-try:
-    background_img = pygame.image.load(background_path).convert_alpha()
-    background_img = pygame.transform.smoothscale(background_img, (WIDTH, HEIGHT))
-    if DEBUG:
-        print("Happy birthday background loaded successfully.")
-except FileNotFoundError:
-    print(f"happy_birthday_background.png not found at {background_path}! Using white background.")
-    background_img = None
-except pygame.error as e:
-    print(f"Error loading happy_birthday_background.png: {e}. Using white background.")
-    background_img = None
+def load_image_32(filename):
+    # 32-bit with alpha, so smoothscale works even before a display mode is set
+    img = pygame.image.load(filename)
+    converted = pygame.Surface(img.get_size(), pygame.SRCALPHA, 32)
+    converted.blit(img, (0, 0))
+    return converted
 
-# Load Player (your photo)
-try:
-    player_img = pygame.image.load(os.path.join(ASSET_DIR, "photo_2025-03-06_01-21-11.jpg")).convert_alpha()
-    player_img = scale_image(player_img, 60)
-    if DEBUG:
-        print("Player image (photo_2025-03-06_01-21-11.jpg) loaded successfully.")
-except FileNotFoundError:
-    print("Player image (photo_2025-03-06_01-21-11.jpg) not found! Using green placeholder.")
-    player_img = pygame.Surface((60, 60), pygame.SRCALPHA)
-    player_img.fill((0, 255, 0))
-
-# Load Enemy (friend's birthday photo)
-try:
-    enemy_img = pygame.image.load(os.path.join(ASSET_DIR, "20250306_012003.jpg")).convert_alpha()
-    enemy_img = scale_image(enemy_img, 50)
-    if DEBUG:
-        print("Enemy image (20250306_012003.jpg) loaded successfully.")
-except FileNotFoundError:
-    print("Enemy image (20250306_012003.jpg) not found! Using red placeholder.")
-    enemy_img = pygame.Surface((50, 50), pygame.SRCALPHA)
-    enemy_img.fill((255, 0, 0))
-
-# Load bullet assets (strawberry) - Increased to 50x50
-def load_sprite_sheet(filename, frame_width, frame_height, num_frames):
-    sheet = pygame.image.load(filename).convert_alpha()
+def placeholder(size, color):
+    img = pygame.Surface(size, pygame.SRCALPHA)
+    img.fill(color)
+    return img
+
+# name: (path, target size as width (keeps aspect) or (width, height), fallback)
+IMAGE_SPECS = {
+    "background": (os.path.join(BASE_DIR, "happy_birthday_background.png"), (WIDTH, HEIGHT), lambda: None),
+    "player": (os.path.join(ASSET_DIR, "photo_2025-03-06_01-21-11.jpg"), 60, lambda: placeholder((60, 60), (0, 255, 0))),
+    "enemy": (os.path.join(ASSET_DIR, "20250306_012003.jpg"), 50, lambda: placeholder((50, 50), (255, 0, 0))),
+    "bullet": (os.path.join(BASE_DIR, "strawberry.png"), 50, lambda: placeholder((50, 50), RED)),
+}
+# name: (path, frame size, frame count, target width)
+SHEET_SPECS = {
+    "bullet": (os.path.join(BASE_DIR, "strawberry_sheet.png"), (50, 50), 4, 50),
+}
+SOUND_FILES = {
+    "shoot": "shoot.wav",
+    "hit": "hit.wav",
+    "enemy_die": "enemy_die.wav",
+}
+ASSET_CACHE_DIR = os.path.join(BASE_DIR, ".asset_cache")
+
+class AssetManager:
+    """Loads images and sounds on first use instead of at import time.
+
+    Prescaled images are cached on disk as raw RGBA buffers keyed by source
+    file, mtime and target size, and come back through pygame.image.frombuffer
+    without decoding or smoothscaling. Sounds decode on a background thread;
+    sound() returns None until a sound is ready or if it failed to load.
+    """
+    def __init__(self, cache_dir=ASSET_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._images = {}
+        self._frames = {}
+        self._sounds = {}
+        self._sound_thread = None
+
+    def image(self, name):
+        if name not in self._images:
+            self._images[name] = self._load_image(name)
+        return self._images[name]
+
+    def frames(self, name):
+        """Animation frames from a sprite sheet, or None if the sheet is missing."""
+        if name not in self._frames:
+            self._frames[name] = self._load_frames(name)
+        return self._frames[name]
+
+    def evict(self, name):
+        """Forget a loaded image and its frames, e.g. once they are packed into the sprite atlas."""
+        self._images.pop(name, None)
+        self._frames.pop(name, None)
+
+    def sound(self, name):
+        self.load_sounds()
+        return self._sounds.get(name)
+
+    def load_sounds(self):
+        """Start decoding every sound on a background thread (once)."""
+        if self._sound_thread is None:
+            self._sound_thread = threading.Thread(target=self._load_sounds, name="sound-loader", daemon=True)
+            self._sound_thread.start()
+
+    def _load_sounds(self):
+        for name, filename in SOUND_FILES.items():
+            try:
+                self._sounds[name] = pygame.mixer.Sound(os.path.join(BASE_DIR, filename))
+                if DEBUG:
+                    print(f"{filename} loaded successfully.")
+            except (FileNotFoundError, pygame.error) as e:
+                print(f"Error loading {filename}: {e}. Continuing without {name} sound.")
+
+    def _load_image(self, name):
+        path, size, fallback = IMAGE_SPECS[name]
+        if isinstance(size, int):
+            variant = f"w{size}"
+            build = lambda: scale_image(load_image_32(path), size)
+        else:
+            variant = f"{size[0]}x{size[1]}"
+            build = lambda: pygame.transform.smoothscale(load_image_32(path), size)
+        try:
+            img = self._cached(path, variant, build)
+            if DEBUG:
+                print(f"{name} image ({os.path.basename(path)}) loaded successfully.")
+            return img
+        except (FileNotFoundError, pygame.error) as e:
+            print(f"Error loading {name} image ({os.path.basename(path)}): {e}. Using placeholder.")
+            return fallback()
+
+    def _load_frames(self, name):
+        path, (frame_width, frame_height), num_frames, target_width = SHEET_SPECS[name]
+        try:
+            frames = []
+            sheet = None
+            for i in range(num_frames):
+                def build(i=i):
+                    nonlocal sheet
+                    if sheet is None:
+                        sheet = load_image_32(path)
+                    frame = sheet.subsurface((i * frame_width, 0, frame_width, frame_height))
+                    return scale_image(frame, target_width)
+                frames.append(self._cached(path, f"{frame_width}x{frame_height}.{i}-w{target_width}", build))
+            if DEBUG:
+                print(f"{name} sprite sheet loaded successfully.")
+            return frames
+        except (FileNotFoundError, ValueError, pygame.error) as e:
+            print(f"Sprite sheet error: {e}. Using static {name} image.")
+            return None
+
+    def _cached(self, path, variant, build):
+        stem = f"{os.path.basename(path)}-{variant}-"
+        cache_path = os.path.join(self.cache_dir, f"{stem}{os.stat(path).st_mtime_ns}.rgba")
+        try:
+            with open(cache_path, "rb") as f:
+                width, height = struct.unpack("<II", f.read(8))
+                img = pygame.image.frombuffer(bytearray(f.read()), (width, height), "RGBA")
+        except (OSError, ValueError, struct.error):
+            img = build()
+            self._write_cache(cache_path, stem, img)
+        if pygame.display.get_surface() is not None:
+            img = img.convert_alpha()
+        return img
+
+    def _write_cache(self, cache_path, stem, img):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for old in os.listdir(self.cache_dir):
+                if old.startswith(stem):
+                    os.remove(os.path.join(self.cache_dir, old))
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(struct.pack("<II", *img.get_size()))
+                f.write(pygame.image.tobytes(img, "RGBA"))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            if DEBUG:
+                print(f"Could not write asset cache {cache_path}: {e}")
+
+assets = AssetManager()
+
+# ========== SPRITE ATLAS ==========
+# Bumped whenever the generated images (power-ups, explosions) or the packing change
+ATLAS_VERSION = 2
+ATLAS_ALIGN = 16  # sheet width multiple, in pixels
+POWERUP_COLORS = {'shield': YELLOW, 'triple': PURPLE, 'bomb': RED}
+EXPLOSION_FRAMES = 4
+
+def explosion_frames():
+    """A quarter turn while shrinking, centred on a fixed canvas."""
+    explosion_img = placeholder((20, 20), RED)
     frames = []
-    for i in range(num_frames):
-        frame = sheet.subsurface((i * frame_width, 0, frame_width, frame_height))
-        frames.append(scale_image(frame, 50))  # Scale to 50x50
+    for i in range(EXPLOSION_FRAMES):
+        frame = transform_cache.get(explosion_img, angle=i * 30, scale=1 - i * 0.2)
+        canvas = pygame.Surface((30, 30), pygame.SRCALPHA)
+        canvas.blit(frame, frame.get_rect(center=canvas.get_rect().center))
+        frames.append(canvas)
     return frames
 
-bullet_frames = None
-try:
-    bullet_frames = load_sprite_sheet(os.path.join(BASE_DIR, "strawberry_sheet.png"), frame_width=50, frame_height=50, num_frames=4)
-    if DEBUG:
-        print("Strawberry sprite sheet loaded successfully.")
-except Exception as e:
-    print(f"Sprite sheet error: {e}. Trying static image.")
-
-if bullet_frames is None:
-    try:
-        bullet_img = pygame.image.load(os.path.join(BASE_DIR, "strawberry.png")).convert_alpha()
-        bullet_img = scale_image(bullet_img, 50)  # Scale to 50x50
-        if DEBUG:
-            print("Static strawberry image loaded successfully.")
-    except (FileNotFoundError, pygame.error) as e:
-        print(f"Error loading strawberry.png: {e}. Using red placeholder bullet.")
-        bullet_img = pygame.Surface((50, 50), pygame.SRCALPHA)  # 50x50 placeholder
-        pygame.draw.rect(bullet_img, RED, (0, 0, 50, 50))
-
-# ========== SOUND LOADING ==========
-shoot_sound = None
-hit_sound = None
-enemy_die_sound = None
-explosion_sound = None
-powerup_sound = None
+def atlas_sources():
+    """Every in-game sprite image by atlas name; animation frames are named `<name>.<index>`."""
+    images = {name: assets.image(name) for name in ("player", "enemy", "bullet")}
+    for i, frame in enumerate(assets.frames("bullet") or ()):
+        images[f"bullet.{i}"] = frame
+    for powerup_type, color in POWERUP_COLORS.items():
+        images[f"powerup.{powerup_type}"] = placeholder((20, 20), color)
+    for i, frame in enumerate(explosion_frames()):
+        images[f"explosion.{i}"] = frame
+    return images
 
-try:
-    shoot_sound = pygame.mixer.Sound(os.path.join(BASE_DIR, "shoot.wav"))
-    if DEBUG:
-        print("shoot.wav loaded successfully.")
-except (FileNotFoundError, pygame.error) as e:
-    print(f"Error loading shoot.wav: {e}. Continuing without shoot sound.")
+def pack_atlas(images, max_width=1024, padding=1):
+    """Shelf-pack {name: Surface} into one surface; returns (sheet, {name: Rect})."""
+    width = max([max_width] + [image.get_width() for image in images.values()])
+    areas = {}
+    x = y = shelf_height = used_width = 0
+    for name in sorted(images, key=lambda name: (-images[name].get_height(), name)):
+        w, h = images[name].get_size()
+        if x + w > width:
+            x, y, shelf_height = 0, y + shelf_height + padding, 0
+        areas[name] = pygame.Rect(x, y, w, h)
+        x += w + padding
+        shelf_height = max(shelf_height, h)
+        used_width = max(used_width, x - padding)
+    # Rows of a whole number of 64-byte lines keep the blitter's copies aligned
+    sheet_width = -(-max(used_width, 1) // ATLAS_ALIGN) * ATLAS_ALIGN
+    sheet = pygame.Surface((sheet_width, max(y + shelf_height, 1)), pygame.SRCALPHA)
+    for name, area in areas.items():
+        sheet.blit(images[name], area)
+    return sheet, areas
 
-try:
-    hit_sound = pygame.mixer.Sound(os.path.join(BASE_DIR, "hit.wav"))
-    if DEBUG:
-        print("hit.wav loaded successfully.")
-except (FileNotFoundError, pygame.error) as e:
-    print(f"Error loading hit.wav: {e}. Continuing without hit sound.")
+class SpriteAtlas:
+    """Every in-game sprite image packed into one sheet.
 
-try:
-    enemy_die_sound = pygame.mixer.Sound(os.path.join(BASE_DIR, "enemy_die.wav"))
-    if DEBUG:
-        print("enemy_die.wav loaded successfully.")
-except (FileNotFoundError, pygame.error) as e:
-    print(f"Error loading enemy_die.wav: {e}. Continuing without enemy_die sound.")
+    image() and frames() hand out subsurfaces of the sheet, and `areas` maps
+    each of them back to its rect, so sprite groups draw with one
+    Surface.blits() call from the sheet. The sheet and its index are cached
+    next to the prescaled images, keyed by the source files; packing only
+    runs when they change (or with --build-atlas).
+    """
+    def __init__(self, cache_dir=ASSET_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.sheet = None
+        self.areas = {}
+        self._images = {}
+
+    def image(self, name):
+        if self.sheet is None:
+            self.load()
+        return self._images[name]
+
+    def frames(self, name):
+        """Animation frames `name.0`, `name.1`, ... or None if there are none."""
+        if self.sheet is None:
+            self.load()
+        frames = []
+        while f"{name}.{len(frames)}" in self._images:
+            frames.append(self._images[f"{name}.{len(frames)}"])
+        return frames or None
 
-if enemy_die_sound and DEBUG:
-    print("Testing enemy_die.wav playback at startup...")
-    enemy_die_sound.play()
-    pygame.time.wait(500)
+    def _key(self):
+        sources = [ATLAS_VERSION]
+        for path, *size in [IMAGE_SPECS[name][:2] for name in ("player", "enemy", "bullet")] + [SHEET_SPECS["bullet"]]:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                mtime = None
+            sources.append((os.path.basename(path), size, mtime))
+        return hashlib.sha1(repr(sources).encode()).hexdigest()[:16]
 
-explosion_sound = None
-powerup_sound = None
+    def load(self, rebuild=False):
+        """Load the cached sheet, packing a new one if it is missing, stale or `rebuild` is set."""
+        stem = os.path.join(self.cache_dir, f"atlas-{self._key()}")
+        sheet = None
+        if not rebuild:
+            try:
+                with open(stem + ".json") as f:
+                    index = {name: pygame.Rect(rect) for name, rect in json.load(f).items()}
+                with open(stem + ".rgba", "rb") as f:
+                    width, height = struct.unpack("<II", f.read(8))
+                    sheet = pygame.image.frombuffer(bytearray(f.read()), (width, height), "RGBA")
+            except (OSError, ValueError, TypeError, struct.error):
+                sheet = None
+        if sheet is None:
+            sources = atlas_sources()
+            sheet, index = pack_atlas(sources)
+            for name in ("player", "enemy", "bullet"):
+                assets.evict(name)
+            self._write(stem, sheet, index)
+        if pygame.display.get_surface() is not None:
+            sheet = sheet.convert_alpha()
+        self.sheet = sheet
+        self._images = {name: sheet.subsurface(area) for name, area in index.items()}
+        self.areas = {image: index[name] for name, image in self._images.items()}
 
+    def _write(self, stem, sheet, index):
+        assets._write_cache(stem + ".rgba", "atlas-", sheet)
+        try:
+            with open(stem + ".json.tmp", "w") as f:
+                json.dump({name: list(area) for name, area in index.items()}, f)
+            os.replace(stem + ".json.tmp", stem + ".json")
+        except OSError as e:
+            if DEBUG:
+                print(f"Could not write atlas index {stem}.json: {e}")
+
+atlas = SpriteAtlas()
+
+# ========== AUDIO ==========
 # Sound cooldown to prevent echo
-last_enemy_die_time = 0
 SOUND_COOLDOWN = 100  # milliseconds
 
+# name: (priority, max simultaneous voices, cooldown in ms)
+SOUND_RULES = {
+    "explosion": (3, 2, SOUND_COOLDOWN),
+    "hit": (3, 1, SOUND_COOLDOWN),
+    "powerup": (2, 1, 0),
+    "enemy_die": (2, 2, SOUND_COOLDOWN),
+    "shoot": (1, 3, 0),
+}
+
+class AudioManager:
+    """Queues play requests during a frame and starts them all in one flush().
+
+    A request for a sound already queued this frame, or played within its
+    cooldown, is coalesced into that one. flush() plays the queue in priority
+    order, capping each sound at its voice limit; only a sound that actually
+    started begins a cooldown. The first `reserved` mixer channels are held
+    back for sounds of at least `reserve_priority`, so a burst of shots cannot
+    starve explosions. Per-sound played, dropped (not loaded, or no voice or
+    channel free) and coalesced counts are kept for reporting.
+    """
+    def __init__(self, channels=16, reserved=4, reserve_priority=2, rules=SOUND_RULES):
+        self.channels = channels
+        self.reserved = reserved
+        self.reserve_priority = reserve_priority
+        self.rules = rules
+        self.played = Counter()
+        self.dropped = Counter()
+        self.coalesced = Counter()
+        self._queue = {}
+        self._last_played = {}
+        self._voices = {}
+        self._mixer_ready = False
+
+    def play(self, name, now):
+        """Queue `name` for the next flush(); `now` is the game clock time in ms."""
+        cooldown = self.rules.get(name, (0, 1, 0))[2]
+        if name in self._queue or now - self._last_played.get(name, -math.inf) < cooldown:
+            self.coalesced[name] += 1
+            return
+        self._queue[name] = now
+
+    def _setup_mixer(self):
+        if not self._mixer_ready and pygame.mixer.get_init():
+            pygame.mixer.set_num_channels(self.channels)
+            pygame.mixer.set_reserved(self.reserved)
+            self._mixer_ready = True
+        return self._mixer_ready
+
+    def _find_channel(self, priority):
+        channel = pygame.mixer.find_channel()
+        if channel is None and priority >= self.reserve_priority:
+            for i in range(self.reserved):
+                if not pygame.mixer.Channel(i).get_busy():
+                    return pygame.mixer.Channel(i)
+        return channel
+
+    def flush(self):
+        """Start every queued sound; call once per frame."""
+        if not self._queue:
+            return
+        queue = sorted(self._queue.items(), key=lambda item: self.rules.get(item[0], (0,))[0], reverse=True)
+        self._queue.clear()
+        if not self._setup_mixer():
+            return
+        for name, now in queue:
+            sound = assets.sound(name)  # None while still decoding on the loader thread
+            priority, max_voices, _ = self.rules.get(name, (0, 1, 0))
+            channel = None
+            if sound is not None:
+                voices = [c for c in self._voices.get(name, ()) if c.get_busy() and c.get_sound() is sound]
+                channel = self._find_channel(priority) if len(voices) < max_voices else None
+            if channel is None:
+                self.dropped[name] += 1
+                profiler.count("sounds_dropped")
+                continue
+            channel.play(sound)
+            voices.append(channel)
+            self._voices[name] = voices
+            self._last_played[name] = now
+            self.played[name] += 1
+            profiler.count("sounds_played")
+
+    def reset(self):
+        self._queue.clear()
+        self._last_played.clear()
+
+    def stats(self):
+        return {name: {"played": self.played[name], "dropped": self.dropped[name],
+                       "coalesced": self.coalesced[name]}
+                for name in sorted(set(self.played) | set(self.dropped) | set(self.coalesced))}
+
+audio_manager = AudioManager()
+
+# ========== PROFILING ==========
+class FrameProfiler:
+    """Per-phase frame timing with rolling percentiles, counters and traces.
+
+    Call begin_frame(), then mark(phase) as each phase of the frame finishes,
+    then end_frame(). Every method returns immediately while disabled, so the
+    calls can stay in the hot path. F3 toggles the on-screen overlay.
+    """
+    GRAPH_FRAMES = 120
+    PANEL_REFRESH = 10  # frames between overlay text updates
+
+    def __init__(self, window=300):
+        self.window = window
+        self.enabled = False
+        self.timing = False
+        self.overlay = False
+        self.tracing = False
+        self.frame = 0
+        self.frame_times = deque(maxlen=window)
+        self.history = {}
+        self.counters = Counter()
+        self.frame_counters = Counter()
+        self.sprite_counts = {}
+        self.trace = []
+        self._phases = {}
+        self._start = 0
+        self._last = 0
+        self._panel = None
+
+    def _update_enabled(self):
+        self.enabled = self.timing or self.overlay or self.tracing
+
+    def enable(self):
+        """Collect timings and counters without drawing the overlay."""
+        self.timing = True
+        self._update_enabled()
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self._panel = None
+        self._update_enabled()
+
+    def start_trace(self):
+        self.tracing = True
+        self._update_enabled()
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self._phases = {}
+        self._start = self._last = time.perf_counter_ns()
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        self._phases[phase] = self._phases.get(phase, 0) + now - self._last
+        self._last = now
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.frame_counters[name] += n
+
+    def end_frame(self, sprite_counts=None):
+        """Close the frame; `sprite_counts` is a callable returning {group name: count}."""
+        if not self.enabled:
+            return
+        total = self._last - self._start
+        self.frame_times.append(total)
+        for phase, elapsed in self._phases.items():
+            if phase not in self.history:
+                self.history[phase] = deque(maxlen=self.window)
+            self.history[phase].append(elapsed)
+        if sprite_counts is not None:
+            self.sprite_counts = sprite_counts()
+        self.counters.update(self.frame_counters)
+        if self.tracing:
+            record = {"frame": self.frame, "total_ns": total}
+            record.update((f"{phase}_ns", elapsed) for phase, elapsed in self._phases.items())
+            record.update((f"sprites.{name}", n) for name, n in self.sprite_counts.items())
+            record.update(self.frame_counters)
+            self.trace.append(record)
+        self.frame_counters.clear()
+        self.frame += 1
+
+    def percentiles(self, phase=None):
+        """(p50, p95, p99) in milliseconds over the rolling window; the whole frame if phase is None."""
+        samples = self.frame_times if phase is None else self.history.get(phase, ())
+        if not samples:
+            return (0.0, 0.0, 0.0)
+        p50, p95, p99 = np.percentile(np.fromiter(samples, dtype=np.int64), [50, 95, 99]) / 1e6
+        return (p50, p95, p99)
+
+    def summary(self):
+        phases = {"frame": self.percentiles()}
+        phases.update((phase, self.percentiles(phase)) for phase in self.history)
+        return {"frames": self.frame, "phases_ms": phases, "sprites": dict(self.sprite_counts),
+                "counters": dict(self.counters)}
+
+    def dump(self, path):
+        """Write the per-frame trace as CSV (for *.csv paths) or JSON."""
+        if path.endswith(".csv"):
+            fieldnames = []
+            for record in self.trace:
+                fieldnames.extend(key for key in record if key not in fieldnames)
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames, restval=0)
+                writer.writeheader()
+                writer.writerows(self.trace)
+        else:
+            with open(path, "w") as f:
+                json.dump({"summary": self.summary(), "frames": self.trace}, f)
+
+    def overlay_blit(self):
+        """The overlay (frame-time graph plus percentile/count text) as a (surface, pos) blit."""
+        if self._panel is None or self.frame % self.PANEL_REFRESH == 0:
+            self._panel = self._render_panel()
+        return self._panel, (WIDTH - self._panel.get_width() - 10, HEIGHT - self._panel.get_height() - 10)
+
+    def _render_panel(self):
+        lines = ["frame p50/p95/p99: %.2f / %.2f / %.2f ms" % self.percentiles()]
+        for phase in self.history:
+            lines.append(f"{phase}: " + "%.2f / %.2f / %.2f" % self.percentiles(phase))
+        counts = [f"{name}:{n}" for name, n in self.sprite_counts.items()]
+        for i in range(0, len(counts), 4):
+            lines.append(" ".join(counts[i:i + 4]))
+        graph_height = 60
+        panel = pygame.Surface((300, graph_height + 10 + 18 * len(lines)), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+        budget_y = graph_height // 2  # the graph spans two frame budgets
+        pygame.draw.line(panel, YELLOW, (0, budget_y), (panel.get_width(), budget_y))
+        for i, elapsed in enumerate(list(self.frame_times)[-self.GRAPH_FRAMES:]):
+            ms = elapsed / 1e6
+            bar = min(graph_height, int(graph_height * ms / (2 * FRAME_MS)))
+            color = (0, 200, 0) if ms <= FRAME_MS else RED
+            pygame.draw.line(panel, color, (i * 2 + 5, graph_height), (i * 2 + 5, graph_height - bar))
+        for i, line in enumerate(lines):
+            panel.blit(text_cache.render(line, 20, WHITE), (5, graph_height + 8 + 18 * i))
+        return panel
+
+profiler = FrameProfiler()
+
+# ========== KINEMATICS ==========
+class Kinematics:
+    """Float positions and velocities for a batch of moving things, integrated together.
+
+    Positions keep their sub-pixel part from frame to frame; whole-pixel
+    positions for rects are derived with pixels(). Velocities are in pixels
+    per 60 FPS frame and integrate() scales them by dt frames. The positions
+    before the last integrate() are kept in prev so rendering can interpolate
+    between steps; anything placed directly must set prev as well.
+    """
+    def __init__(self, capacity, dtype=np.float64):
+        self.pos = np.zeros((capacity, 2), dtype=dtype)
+        self.prev = np.zeros((capacity, 2), dtype=dtype)
+        self.vel = np.zeros((capacity, 2), dtype=dtype)
+
+    def __len__(self):
+        return len(self.pos)
+
+    def grow(self, capacity):
+        for name in ("pos", "prev", "vel"):
+            array = getattr(self, name)
+            grown = np.zeros((capacity, 2), dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def integrate(self, index=slice(None), dt=1.0):
+        """Advance the entries selected by `index` (a slice or mask) by dt frames."""
+        pos = self.pos
+        self.prev[index] = pos[index]
+        if dt == 1.0:
+            pos[index] += self.vel[index]
+        else:
+            pos[index] += self.vel[index] * dt
+
+    def lerp(self, alpha=1.0, index=slice(None)):
+        """Positions `alpha` of the way from the previous step to the current one."""
+        if alpha == 1.0:
+            return self.pos[index]
+        prev = self.prev[index]
+        return prev + (self.pos[index] - prev) * alpha
+
+    def pixels(self, alpha=1.0, index=slice(None)):
+        """Positions rounded to whole pixels (half away from zero, as pygame rects round)."""
+        pos = self.lerp(alpha, index)
+        return np.trunc(pos + np.copysign(0.5, pos)).astype(np.int32)
+
 # ========== PARTICLE EFFECTS ==========
-class Particle(pygame.sprite.Sprite):
-    def __init__(self, pos, color=PINK, radius=3, lifespan=20):
-        super().__init__()
-        self.pos = list(pos)
-        self.radius = radius
-        self.lifespan = lifespan
-        self.image = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
-        pygame.draw.circle(self.image, color, (radius, radius), radius)
-        self.rect = self.image.get_rect(center=pos)
-        self.velocity = [random.uniform(-2, 2), random.uniform(-2, 2)]
-        
-    def update(self):
-        self.lifespan -= 1
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
-        self.rect.center = self.pos
-        if self.lifespan <= 0:
-            self.kill()
+class ParticleSystem:
+    """All particles live in preallocated NumPy arrays and are updated in one step.
+
+    A slot is free when its lifespan is 0, so dead particles are reused by the
+    next emit. Circles are drawn from stamps cached by (radius, colour); past
+    MAX_STAMPS the least recently used stamp no live particle needs is replaced.
+    """
+    MAX_STAMPS = 256
+
+    def __init__(self, capacity=4096, seed=None):
+        self.capacity = capacity
+        self.motion = Kinematics(capacity, dtype=np.float32)
+        self.lifespan = np.zeros(capacity, dtype=np.int32)
+        self.radius = np.zeros(capacity, dtype=np.int32)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+        self.stamp_id = np.zeros(capacity, dtype=np.int32)
+        self.rng = np.random.default_rng(seed)
+        self._stamps = []
+        self._stamp_index = OrderedDict()  # (radius, colour) -> stamp index, least recently used first
+
+    def __len__(self):
+        return int(np.count_nonzero(self.lifespan))
+
+    def _stamp(self, radius, color):
+        key = (radius, color)
+        index = self._stamp_index.get(key)
+        if index is not None:
+            self._stamp_index.move_to_end(key)
+            return index
+        image = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+        pygame.draw.circle(image, color, (radius, radius), radius)
+        index = len(self._stamps)
+        if index >= self.MAX_STAMPS:
+            # Reuse the least recently used stamp no live particle is drawn with
+            in_use = set(np.unique(self.stamp_id[self.lifespan > 0]).tolist())
+            old_key = next((old for old, old_index in self._stamp_index.items() if old_index not in in_use), None)
+            if old_key is not None:
+                index = self._stamp_index.pop(old_key)
+        if index == len(self._stamps):
+            self._stamps.append(image)
+        else:
+            self._stamps[index] = image
+        self._stamp_index[key] = index
+        return index
+
+    def emit(self, pos, count, color=PINK, radius=(3, 3), lifespan=(20, 20), spread=0, speed=2):
+        """Spawn up to `count` particles around `pos`; returns how many fit.
+
+        `radius` and `lifespan` are inclusive (min, max) ranges like
+        random.randint. `spread` jitters the start position by up to that many
+        pixels and `speed` bounds each velocity component.
+        """
+        free = np.flatnonzero(self.lifespan == 0)[:count]
+        n = len(free)
+        if n == 0:
+            return 0
+        color = tuple(color[:3])
+        motion = self.motion
+        motion.pos[free] = pos
+        if spread:
+            motion.pos[free] += self.rng.uniform(-spread, spread, (n, 2))
+        motion.prev[free] = motion.pos[free]
+        motion.vel[free] = self.rng.uniform(-speed, speed, (n, 2))
+        self.lifespan[free] = self.rng.integers(lifespan[0], lifespan[1] + 1, n)
+        radii = self.rng.integers(radius[0], radius[1] + 1, n)
+        self.radius[free] = radii
+        self.color[free] = color
+        # One radius at a time, so a stamp made for this emit counts as in use before the next is made
+        for r in np.unique(radii).tolist():
+            self.stamp_id[free[radii == r]] = self._stamp(r, color)
+        return n
+
+    def reseed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, dt=1.0):
+        alive = self.lifespan > 0
+        if alive.any():
+            # Dead slots move too: cheaper than masking, and emit() overwrites them
+            self.motion.integrate(dt=dt)
+            self.lifespan[alive] -= 1
+
+    def blits(self, alpha=1.0):
+        """The live particles as (stamp, pos) blits, `alpha` of the way through the step."""
+        alive = np.flatnonzero(self.lifespan)
+        if not len(alive):
+            return []
+        stamps = self._stamps
+        topleft = (self.motion.lerp(alpha)[alive] - self.radius[alive, None]).astype(np.int32).tolist()
+        return [(stamps[i], xy) for i, xy in zip(self.stamp_id[alive].tolist(), topleft)]
+
+    def clear(self):
+        self.lifespan[:] = 0
+
+particle_system = ParticleSystem()
+
+# ========== ENEMY BULLETS ==========
+# (radius, colour) per bullet style; styles are stored by index so snapshots can rebuild them
+BULLET_STYLES = ((5, (255, 80, 80)), (4, (255, 170, 60)), (4, (200, 120, 255)), (6, (120, 220, 255)))
+
+class EnemyBullets(ParticleSystem):
+    """Enemy bullets, stored like particles: preallocated array slots that are
+    fired in batches and moved, culled and drawn in single NumPy passes.
+
+    A bullet lives until it leaves the screen or hits the player (lifespan only
+    caps stragglers). fire() returns how many bullets fit; the rest are dropped.
+    """
+    def __init__(self, capacity=8192, lifespan=900):
+        super().__init__(capacity)
+        self.style = np.zeros(capacity, dtype=np.uint8)
+        self.max_lifespan = lifespan
+
+    def fire(self, pos, angles, speed, style=0):
+        """Fire one bullet per angle (radians, 0 = right, pi/2 = down) from `pos`."""
+        free = np.flatnonzero(self.lifespan == 0)[:len(angles)]
+        n = len(free)
+        if n == 0:
+            profiler.count("enemy_bullets_dropped", len(angles))
+            return 0
+        angles = angles[:n]
+        motion = self.motion
+        motion.pos[free] = pos
+        motion.prev[free] = pos
+        motion.vel[free, 0] = np.cos(angles) * speed
+        motion.vel[free, 1] = np.sin(angles) * speed
+        radius, color = BULLET_STYLES[style]
+        self.lifespan[free] = self.max_lifespan
+        self.radius[free] = radius
+        self.color[free] = color
+        self.style[free] = style
+        self.stamp_id[free] = self._stamp(radius, color)
+        return n
+
+    def update(self, dt=1.0):
+        alive = self.lifespan > 0
+        if alive.any():
+            self.motion.integrate(dt=dt)
+            self.lifespan[alive] -= 1
+            pos, radius = self.motion.pos, self.radius
+            outside = ((pos[:, 0] < -radius) | (pos[:, 0] > WIDTH + radius) |
+                       (pos[:, 1] < -radius) | (pos[:, 1] > HEIGHT + radius))
+            self.lifespan[outside] = 0
+
+    def collide_rect(self, rect):
+        """Remove the bullets whose circles touch `rect`; returns how many did."""
+        alive = np.flatnonzero(self.lifespan)
+        if not len(alive):
+            return 0
+        pos = self.motion.pos[alive]
+        radius = self.radius[alive]
+        # Distance from each centre to the nearest point of the rect
+        dx = pos[:, 0] - np.clip(pos[:, 0], rect.left, rect.right)
+        dy = pos[:, 1] - np.clip(pos[:, 1], rect.top, rect.bottom)
+        hit = alive[dx * dx + dy * dy <= radius * radius]
+        self.lifespan[hit] = 0
+        return len(hit)
+
+    def state(self):
+        """Live bullets in slot order as NumPy columns: an (n, 4) float64 array of
+        (x, y, x_speed, y_speed) rows, then int32 lifespans and uint8 styles."""
+        alive = np.flatnonzero(self.lifespan)
+        motion = np.empty((len(alive), 4))
+        motion[:, 0:2] = self.motion.pos[alive]
+        motion[:, 2:4] = self.motion.vel[alive]
+        return motion, self.lifespan[alive], self.style[alive]
+
+    def load(self, bullets):
+        """Replace all bullets with those from state()."""
+        motion, lifespans, styles = bullets
+        self.clear()
+        n = len(lifespans)
+        if not n:
+            return
+        self.motion.pos[:n] = self.motion.prev[:n] = motion[:, 0:2]
+        self.motion.vel[:n] = motion[:, 2:4]
+        self.lifespan[:n] = lifespans
+        self.style[:n] = styles
+        for style in np.unique(styles).tolist():
+            radius, color = BULLET_STYLES[style]
+            slots = np.flatnonzero(styles == style)
+            self.radius[slots] = radius
+            self.color[slots] = color
+            self.stamp_id[slots] = self._stamp(radius, color)
+
+# A bullet pattern as a parametric emitter: every `interval` frames it fires
+# `count` bullets at `speed`, fanned evenly over `spread` degrees (360 makes a
+# ring) around a base direction. The base is straight down, or at the player
+# when `aim` is set, and turns by `spin` degrees per shot (spirals).
+Emitter = namedtuple("Emitter", ["count", "spread", "speed", "interval", "aim", "spin", "style"],
+                     defaults=(1, 0, 3, 30, False, 0, 0))
+
+BOSS_PATTERNS = {
+    "aimed": Emitter(count=3, spread=12, speed=4, interval=24, aim=True),
+    "fan": Emitter(count=9, spread=90, speed=3, interval=40, aim=True, style=1),
+    "spiral": Emitter(count=4, spread=360, speed=2.5, interval=5, spin=11, style=2),
+    "ring": Emitter(count=36, spread=360, speed=2, interval=50, style=3),
+}
+# (pattern, frames) cycled through for the whole fight
+BOSS_PHASES = (("aimed", 180), ("fan", 180), ("spiral", 240), ("ring", 200))
+BOSS_CYCLE = sum(frames for _, frames in BOSS_PHASES)
+
+def emitter_angles(emitter, base_deg):
+    """The directions (radians) of one shot from an emitter aimed at base_deg."""
+    if emitter.count == 1:
+        offsets = np.zeros(1)
+    elif emitter.spread >= 360:
+        offsets = np.arange(emitter.count) * (360 / emitter.count)
+    else:
+        offsets = np.linspace(-emitter.spread / 2, emitter.spread / 2, emitter.count)
+    return np.radians(base_deg + offsets)
+
+# ========== TEXT RENDERING ==========
+class TextCache:
+    """Font registry plus an LRU cache of rendered text surfaces.
+
+    Surfaces are keyed by (text, size, colour, shadow colour, shadow offset);
+    text with a shadow is pre-composited into a single surface. The cache
+    evicts least recently used entries once it holds more than max_bytes.
+    """
+    def __init__(self, max_bytes=2 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes_used = 0
+        self._fonts = {}
+        self._surfaces = OrderedDict()
+
+    def font(self, size):
+        font = self._fonts.get(size)
+        if font is None:
+            font = self._fonts[size] = pygame.font.Font(None, size)
+        return font
+
+    def render(self, text, size, color, shadow_color=None, shadow_offset=(2, 2)):
+        key = (text, size, color, shadow_color, shadow_offset)
+        image = self._surfaces.get(key)
+        if image is not None:
+            self._surfaces.move_to_end(key)
+            return image
+
+        font = self.font(size)
+        main_text = font.render(text, True, color)
+        if shadow_color is None:
+            image = main_text
+        else:
+            dx, dy = shadow_offset
+            image = pygame.Surface((main_text.get_width() + abs(dx), main_text.get_height() + abs(dy)),
+                                   pygame.SRCALPHA)
+            image.blit(font.render(text, True, shadow_color), (max(dx, 0), max(dy, 0)))
+            image.blit(main_text, (max(-dx, 0), max(-dy, 0)))
+
+        self._surfaces[key] = image
+        self.bytes_used += image.get_width() * image.get_height() * image.get_bytesize()
+        while self.bytes_used > self.max_bytes and len(self._surfaces) > 1:
+            _, old = self._surfaces.popitem(last=False)
+            self.bytes_used -= old.get_width() * old.get_height() * old.get_bytesize()
+        return image
+
+class DigitAtlas:
+    """Pre-rendered, shadowed digit glyphs so a changing number allocates nothing."""
+    def __init__(self, cache, size, color, shadow_color=BLACK, shadow_offset=(2, 2)):
+        self.cache = cache
+        self.size = size
+        self.color = color
+        self.shadow_color = shadow_color
+        self.shadow_offset = shadow_offset
+        font = cache.font(size)
+        self.glyphs = {}
+        self.advances = {}
+        for ch in "0123456789-":
+            self.glyphs[ch] = cache.render(ch, size, color, shadow_color, shadow_offset)
+            self.advances[ch] = font.size(ch)[0]
+
+    def blits(self, label, value, pos):
+        """Blits for `label` from the text cache followed by `value` from the atlas."""
+        x = pos[0] + min(self.shadow_offset[0], 0)
+        y = pos[1] + min(self.shadow_offset[1], 0)
+        blits = [(self.cache.render(label, self.size, self.color, self.shadow_color, self.shadow_offset), (x, y))]
+        x += self.cache.font(self.size).size(label)[0]
+        for ch in str(value):
+            blits.append((self.glyphs[ch], (x, y)))
+            x += self.advances[ch]
+        return blits
+
+text_cache = TextCache()
+score_digits = DigitAtlas(text_cache, 36, WHITE)
+
+# ========== TRANSFORM CACHE ==========
+class TransformCache:
+    """LRU cache of rotated and scaled copies of surfaces.
+
+    Angles snap to multiples of angle_step degrees and scales to multiples of
+    scale_step, so a spinning or pulsing image cycles through a fixed set of
+    transformed copies instead of transforming every frame. Copies are keyed
+    by the source surface, which must not be drawn on afterwards. The cache
+    evicts least recently used copies once it holds more than max_bytes.
+    """
+    def __init__(self, max_bytes=8 * 1024 * 1024, angle_step=5, scale_step=0.02):
+        self.max_bytes = max_bytes
+        self.angle_step = angle_step
+        self.scale_step = scale_step
+        self.bytes_used = 0
+        self._surfaces = OrderedDict()
+
+    def get(self, surface, angle=0, scale=1.0, angle_step=None, scale_step=None):
+        """`surface` rotated by `angle` degrees and scaled by `scale`, both snapped to their steps."""
+        angle_step = angle_step or self.angle_step
+        scale_step = scale_step or self.scale_step
+        angle = round(angle / angle_step) * angle_step % 360
+        scale = round(round(scale / scale_step) * scale_step, 6)
+        if angle == 0 and scale == 1:
+            return surface
+        key = (surface, angle, scale)
+        image = self._surfaces.get(key)
+        if image is not None:
+            self._surfaces.move_to_end(key)
+            return image
+
+        image = surface
+        if scale != 1:
+            image = pygame.transform.scale(image, (max(1, int(surface.get_width() * scale)),
+                                                   max(1, int(surface.get_height() * scale))))
+        if angle:
+            image = pygame.transform.rotate(image, angle)
+        self._surfaces[key] = image
+        self.bytes_used += image.get_width() * image.get_height() * image.get_bytesize()
+        while self.bytes_used > self.max_bytes and len(self._surfaces) > 1:
+            _, old = self._surfaces.popitem(last=False)
+            self.bytes_used -= old.get_width() * old.get_height() * old.get_bytesize()
+        return image
+
+    def precompute(self, surface, scale=1.0, angle_step=None, start=0, stop=360):
+        """Fill in the copies of `surface` at `scale` from `start` up to `stop` degrees; returns them in angle order."""
+        angle_step = angle_step or self.angle_step
+        return [self.get(surface, start + i * angle_step, scale, angle_step)
+                for i in range(int(math.ceil((stop - start) / angle_step)))]
+
+transform_cache = TransformCache()
+
+# ========== OBJECT POOLS ==========
+class SpritePool:
+    """Bounded free list that recycles sprites of one class.
+
+    acquire() reuses a released sprite (re-initialised in place through its
+    reset()) or builds a new one, then adds it to the given groups. Pooled
+    sprites hand themselves back on kill(), so kill()-based lifetimes keep
+    working. At most max_free sprites are kept; extras are left to the GC.
+    """
+    def __init__(self, cls, max_free=256):
+        self.cls = cls
+        self.max_free = max_free
+        self._free = []
+        self.created = 0
+        self.reused = 0
+        self.dropped = 0
+        self.in_use = 0
+        self.high_water = 0
+
+    def acquire(self, groups, *args, **kwargs):
+        if self._free:
+            sprite = self._free.pop()
+            sprite.reset(*args, **kwargs)
+            self.reused += 1
+        else:
+            sprite = self.cls(*args, **kwargs)
+            self.created += 1
+        sprite.pool = self
+        sprite.add(*groups)
+        self.in_use += 1
+        self.high_water = max(self.high_water, self.in_use)
+        return sprite
+
+    def release(self, sprite):
+        sprite.pool = None
+        self.in_use -= 1
+        if len(self._free) < self.max_free:
+            self._free.append(sprite)
+        else:
+            self.dropped += 1
+
+    def stats(self):
+        return {"class": self.cls.__name__, "in_use": self.in_use, "high_water": self.high_water,
+                "free": len(self._free), "created": self.created, "reused": self.reused,
+                "dropped": self.dropped}
+
+class PooledSprite(pygame.sprite.Sprite):
+    """Sprite that returns to the SpritePool it came from when killed."""
+    pool = None
+
+    def kill(self):
+        super().kill()
+        if self.pool is not None:
+            self.pool.release(self)
+
+# ========== ENTITY ARRAYS ==========
+class ArrayGroup(pygame.sprite.Group):
+    """Sprite group that keeps its members' motion in NumPy structure-of-arrays storage.
+
+    Float positions and velocities (a shared Kinematics), sizes, animation
+    frames, lifetimes and an alive mask live in array slots, so update() moves,
+    culls, ages and animates every member in one vectorized pass. The sprites
+    are views kept for collisions and drawing: sync() writes the whole-pixel
+    rects back in one batched pass per frame.
+
+    A sprite's rect, velocity and the optional frames, frame_index,
+    animation_timer and lifetime (frames to live) are read when it joins the
+    group, so set them before adding it; move members with place().
+
+    New members take the lowest free slot and the slot range in use shrinks
+    as the top members leave, so the passes only cover what is alive after
+    a burst. Groups of up to SMALL members write every rect in sync() rather
+    than paying for the vectorized change test.
+    """
+    frame_ticks = 5  # Frames between animation frame advances
+    SMALL = 32
+
+    def __init__(self, *sprites, bounds=(-math.inf, -math.inf, math.inf, math.inf), capacity=256):
+        # Members are killed once their rect is entirely outside bounds (min_x, min_y, max_x, max_y)
+        self.bounds = bounds
+        # (axis, limit, is a max bound) for the finite bounds only
+        self._cull = [(axis, limit, is_max) for axis, limit, is_max in
+                      ((0, bounds[0], False), (1, bounds[1], False), (0, bounds[2], True), (1, bounds[3], True))
+                      if abs(limit) != math.inf]
+        self.motion = Kinematics(capacity)
+        self.pixel = np.zeros((capacity, 2), np.int32)  # Rect topleft as last written
+        self.size = np.zeros((capacity, 2))
+        self.frame = np.zeros(capacity, np.int32)
+        self.frame_count = np.zeros(capacity, np.int32)  # 0 when not animated
+        self.timer = np.zeros(capacity, np.int32)
+        self.ttl = np.zeros(capacity)
+        self.alive = np.zeros(capacity, bool)
+        self.views = [None] * capacity
+        self.rects = [None] * capacity
+        self.slots = {}
+        self._free = list(range(capacity))  # min-heap, so slots stay packed at the bottom
+        self._high = 0  # Every used slot is below this
+        self._animated = 0
+        self._mortal = 0
+        super().__init__(*sprites)
+
+    def _grow(self):
+        capacity = len(self.views)
+        self.motion.grow(capacity * 2)
+        for name in ("pixel", "size", "frame", "frame_count", "timer", "ttl", "alive"):
+            array = getattr(self, name)
+            grown = np.zeros((capacity * 2,) + array.shape[1:], array.dtype)
+            grown[:capacity] = array
+            setattr(self, name, grown)
+        self.views.extend([None] * capacity)
+        self.rects.extend([None] * capacity)
+        self._free.extend(range(capacity, capacity * 2))  # all above the heap's current slots
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        if not self._free:
+            self._grow()
+        slot = heapq.heappop(self._free)
+        self._high = max(self._high, slot + 1)
+        self.slots[sprite] = slot
+        self.views[slot] = sprite
+        rect = self.rects[slot] = sprite.rect
+        self.motion.pos[slot] = self.motion.prev[slot] = self.pixel[slot] = rect.topleft
+        self.motion.vel[slot] = sprite.velocity
+        self.size[slot] = rect.size
+        frames = getattr(sprite, "frames", None)
+        self.frame[slot] = getattr(sprite, "frame_index", 0)
+        self.frame_count[slot] = len(frames) if frames else 0
+        self.timer[slot] = getattr(sprite, "animation_timer", 0)
+        lifetime = getattr(sprite, "lifetime", None)
+        self.ttl[slot] = math.inf if lifetime is None else lifetime
+        self.alive[slot] = True
+        self._animated += bool(frames)
+        self._mortal += lifetime is not None
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        slot = self.slots.pop(sprite)
+        self._animated -= bool(self.frame_count[slot])
+        self._mortal -= self.ttl[slot] != math.inf
+        self.alive[slot] = False
+        self.views[slot] = None
+        self.rects[slot] = None
+        heapq.heappush(self._free, slot)
+        if slot + 1 == self._high:
+            high = slot
+            alive = self.alive
+            while high and not alive[high - 1]:
+                high -= 1
+            self._high = high
+
+    def position(self, sprite):
+        """Float topleft of a member."""
+        x, y = self.motion.pos[self.slots[sprite]]
+        return float(x), float(y)
+
+    def place(self, sprite, x, y):
+        """Move a member to the float topleft (x, y)."""
+        slot = self.slots[sprite]
+        self.motion.pos[slot] = self.motion.prev[slot] = (x, y)
+        self.pixel[slot] = sprite.rect.topleft = self.motion.pixels(index=slice(slot, slot + 1))[0]
+
+    def anim_state(self, sprite):
+        """(frame_index, animation_timer) of a member."""
+        slot = self.slots[sprite]
+        return int(self.frame[slot]), int(self.timer[slot])
+
+    def update(self, dt=1.0):
+        # Small groups are common, so skip every array pass that has nothing to do
+        if not self.slots:
+            return
+        used = slice(0, self._high)
+        alive = self.alive[used]
+        self.motion.integrate(used, dt)
+        pos = self.motion.pos[used]
+        outside = None
+        for axis, limit, is_max in self._cull:
+            test = pos[:, axis] > limit if is_max else pos[:, axis] + self.size[used, axis] < limit
+            outside = test if outside is None else outside | test
+        if self._mortal:
+            ttl = self.ttl[used]
+            ttl -= 1
+            outside = ttl <= 0 if outside is None else outside | (ttl <= 0)
+
+        advance = None
+        if self._animated:
+            timer = self.timer[used]
+            timer += 1
+            advance = alive & (self.frame_count[used] > 0) & (timer % self.frame_ticks == 0)
+            frame = self.frame[used]
+            frame[advance] = (frame[advance] + 1) % self.frame_count[used][advance]
+
+        views = self.views
+        if outside is not None:
+            outside &= alive
+            if outside.any():
+                for slot in np.flatnonzero(outside).tolist():
+                    views[slot].kill()
+                if advance is not None:
+                    advance &= ~outside
+        if advance is not None:
+            for slot in np.flatnonzero(advance).tolist():
+                sprite = views[slot]
+                sprite.image = sprite.frames[self.frame[slot]]
+
+    def sync(self, alpha=1.0):
+        """Write whole-pixel positions to the rects of members that moved a pixel or more.
+
+        With alpha < 1 the rects are placed between the previous and current
+        step for drawing; sync() again before anything else reads them.
+        """
+        if not self.slots:
+            return
+        high = self._high
+        pixels = self.motion.pixels(alpha, slice(0, high))
+        if len(self.slots) <= self.SMALL:
+            self.pixel[:high] = pixels
+            for rect, topleft in zip(self.rects, pixels.tolist()):
+                if rect is not None:
+                    rect.topleft = topleft
+            return
+        # One int64 compare per row: both arrays hold contiguous int32 pairs
+        moved = pixels.view(np.int64)[:, 0] != self.pixel[:high].view(np.int64)[:, 0]
+        changed = (moved & self.alive[:high]).nonzero()[0]
+        if not len(changed):
+            return
+        self.pixel[changed] = pixels[changed]
+        rects = self.rects
+        for slot, topleft in zip(changed.tolist(), pixels[changed].tolist()):
+            rects[slot].topleft = topleft
 
 # ========== SPRITE CLASSES ==========
-class Player(pygame.sprite.Sprite):
-    def __init__(self):
+class SteppedSprite(pygame.sprite.Sprite):
+    """Sprite whose own update() moves its rect in whole pixels each step.
+
+    The rect from before the last step is kept in prev_rect so rendering can
+    interpolate between steps; anything placing the sprite directly must
+    call settle() as well.
+    """
+    def settle(self):
+        self.prev_rect = self.rect.copy()
+
+    def lerp_rect(self, alpha=1.0):
+        """The rect `alpha` of the way from the previous step to the current one."""
+        rect = self.rect
+        if alpha == 1.0:
+            return rect
+        prev = self.prev_rect
+        return rect.move(round((prev.x - rect.x) * (1 - alpha)), round((prev.y - rect.y) * (1 - alpha)))
+
+class Player(SteppedSprite):
+    def __init__(self, clock=pygame.time):
         super().__init__()
-        self.image = player_img
+        self.clock = clock
+        self.image = atlas.image("player")
         self.rect = self.image.get_rect(midbottom=(WIDTH // 2, HEIGHT - 20))
+        self.settle()
         self.speed = 7
         self.lives = 3
         self.bombs = 1
@@ -184,10 +1256,11 @@ class Player(pygame.sprite.Sprite):
         self.last_shot_time = 0
         self.shoot_cooldown = 200  # 200ms cooldown between shots
 
-    def update(self, keys_pressed):
-        if keys_pressed[pygame.K_LEFT] and self.rect.left > 0:
+    def update(self, inputs):
+        self.prev_rect.topleft = self.rect.topleft
+        if inputs.left and self.rect.left > 0:
             self.rect.x -= self.speed
-        if keys_pressed[pygame.K_RIGHT] and self.rect.right < WIDTH:
+        if inputs.right and self.rect.right < WIDTH:
             self.rect.x += self.speed
         if self.shield_active:
             self.shield_timer += 1
@@ -197,21 +1270,19 @@ class Player(pygame.sprite.Sprite):
             self.triple_shot_timer += 1
             if self.triple_shot_timer >= self.triple_shot_duration:
                 self.triple_shot = False
-        current_time = pygame.time.get_ticks()
-        if keys_pressed[pygame.K_SPACE] and (current_time - self.last_shot_time >= self.shoot_cooldown):
+        current_time = self.clock.get_ticks()
+        if inputs.fire and (current_time - self.last_shot_time >= self.shoot_cooldown):
             return True
         return False
 
-    def shoot(self, bullet_group, all_sprites):
-        current_time = pygame.time.get_ticks()
+    def shoot(self, bullet_group):
+        current_time = self.clock.get_ticks()
         if current_time - self.last_shot_time >= self.shoot_cooldown:
-            bullet = Bullet(self.rect.centerx, self.rect.top, 0, -10)
-            bullet_group.add(bullet)
-            if DEBUG:
-                print(f"Shot fired at {current_time}. Bullet count: {len(bullet_group)}")
+            bullet_pool.acquire((bullet_group,), self.rect.centerx, self.rect.top, 0, -10)
+            profiler.count("shots")
             self.last_shot_time = current_time
-            if shoot_sound:
-                shoot_sound.play()
+            return True
+        return False
 
     def take_damage(self):
         if not self.shield_active:
@@ -219,163 +1290,339 @@ class Player(pygame.sprite.Sprite):
             return True
         return False
 
-    def use_bomb(self, enemy_group, boss_group, all_sprites):
-        global last_enemy_die_time
+    def use_bomb(self, enemy_group, boss_group):
         if self.bombs > 0:
             self.bombs -= 1
-            current_time = pygame.time.get_ticks()
             for enemy in enemy_group:
                 enemy.kill()
-                for _ in range(10):
-                    particle = Particle(enemy.rect.center, PINK, radius=random.randint(2, 5), lifespan=random.randint(20, 40))
-                    all_sprites.add(particle)
+                particle_system.emit(enemy.rect.center, 10, PINK, radius=(2, 5), lifespan=(20, 40))
             if boss_group.sprite:
                 boss_group.sprite.health -= 50
                 if boss_group.sprite.health <= 0:
                     boss_group.sprite.kill()
-            if enemy_die_sound and (current_time - last_enemy_die_time >= SOUND_COOLDOWN):
-                if DEBUG:
-                    print("Playing enemy_die.wav for bomb use")
-                enemy_die_sound.play()
-                last_enemy_die_time = current_time
             return True
         return False
 
-    def draw_shield(self, surface):
+    def shield_blit(self, alpha=1.0):
+        """The shield ring as a (surface, pos) blit, or None without a shield."""
         if self.shield_active:
-            pygame.draw.circle(surface, (0, 255, 255), self.rect.center, 40, 2)
+            x, y = self.lerp_rect(alpha).center
+            return stamp("circle", (80, 80), (0, 255, 255), 2), (x - 40, y - 40)
+
+# Enemy speed profile from a wave file; None falls back to the Balance value
+Archetype = namedtuple("Archetype", ["speed_min", "speed_max", "speed_per_score"], defaults=(None, None, None))
+DEFAULT_ARCHETYPE = Archetype()
 
-class Enemy(pygame.sprite.Sprite):
-    def __init__(self, score):
+def speed_range(archetype, balance, score):
+    """(low, high) bounds of an enemy's speed at `score`."""
+    speed_min, speed_max, speed_per_score = (
+        balance_value if value is None else value
+        for value, balance_value in zip(archetype, (balance.enemy_speed_min, balance.enemy_speed_max,
+                                                    balance.enemy_speed_per_score)))
+    return speed_min, speed_max + score * speed_per_score
+
+class Enemy(PooledSprite):
+    # Moved and culled by the ArrayGroup it belongs to
+    def __init__(self, score, rng=random, balance=DEFAULT_BALANCE, archetype=DEFAULT_ARCHETYPE, pos=None):
         super().__init__()
-        self.image = enemy_img
-        self.rect = self.image.get_rect(midbottom=(random.randint(20, WIDTH - 20), 0))
-        self.speed = random.uniform(0.3, 1.0 + score * 0.005)
+        self.reset(score, rng, balance, archetype, pos)
 
-    def update(self):
-        self.rect.y += self.speed
-        if self.rect.top > HEIGHT:
-            self.kill()
+    def reset(self, score, rng=random, balance=DEFAULT_BALANCE, archetype=DEFAULT_ARCHETYPE, pos=None):
+        # pos is the midbottom; None drops in at a random x just above the screen
+        self.image = atlas.image("enemy")
+        self.rect = self.image.get_rect(midbottom=pos or (rng.randint(20, WIDTH - 20), 0))
+        self.speed = rng.uniform(*speed_range(archetype, balance, score))
+
+    @property
+    def velocity(self):
+        return (0, self.speed)
 
     def take_damage(self):
         return True
 
-class Boss(pygame.sprite.Sprite):
+class Boss(SteppedSprite):
+    SPEED = 2
+
     def __init__(self, health):
         super().__init__()
-        self.image = enemy_img
+        self.image = atlas.image("enemy")
         self.rect = self.image.get_rect(center=(WIDTH // 2, 100))
+        self.settle()
         self.health = health
         self.max_health = health
-
-    def shoot(self, bullet_group):
-        return None
-
-    def aim_at_player(self, player, bullet_group):
-        pass
+        self.timer = 0  # frames into the fight, which picks the pattern
+        self.direction = 1
 
     def update(self):
-        pass
+        # Sweep side to side across the top of the screen
+        self.prev_rect.topleft = self.rect.topleft
+        self.rect.x += self.SPEED * self.direction
+        if self.rect.left <= 0 or self.rect.right >= WIDTH:
+            self.direction = -self.direction
+
+    def shoot(self, bullets, target=None):
+        """Fire the current phase's pattern into `bullets`; returns how many bullets were fired."""
+        phase_frame = self.timer % BOSS_CYCLE
+        self.timer += 1
+        for name, frames in BOSS_PHASES:
+            if phase_frame < frames:
+                break
+            phase_frame -= frames
+        emitter = BOSS_PATTERNS[name]
+        # Twice the rate once below half health
+        interval = emitter.interval if self.health * 2 > self.max_health else max(1, emitter.interval // 2)
+        if phase_frame % interval:
+            return 0
+        x, y = self.rect.center
+        base = 90
+        if emitter.aim and target:
+            base = math.degrees(math.atan2(target.rect.centery - y, target.rect.centerx - x))
+        base += emitter.spin * (phase_frame // interval)
+        return bullets.fire((x, y), emitter_angles(emitter, base), emitter.speed, emitter.style)
 
-class Bullet(pygame.sprite.Sprite):
+class Bullet(PooledSprite):
+    # Moved, culled and animated by the ArrayGroup it belongs to
     def __init__(self, x, y, x_speed, y_speed):
         super().__init__()
-        if bullet_frames:
-            self.frames = bullet_frames
-            self.frame_index = 0
-            self.image = self.frames[self.frame_index]
-        else:
-            self.image = bullet_img
+        self.reset(x, y, x_speed, y_speed)
+
+    def reset(self, x, y, x_speed, y_speed):
+        self.frames = atlas.frames("bullet")
+        self.frame_index = 0
+        self.image = self.frames[0] if self.frames else atlas.image("bullet")
         self.rect = self.image.get_rect(center=(x, y))
         self.x_speed = x_speed
         self.y_speed = y_speed
         self.animation_timer = 0
 
-    def update(self):
-        self.rect.x += self.x_speed
-        self.rect.y += self.y_speed
-        if hasattr(self, 'frames'):
-            self.animation_timer += 1
-            if self.animation_timer % 5 == 0:
-                self.frame_index = (self.frame_index + 1) % len(self.frames)
-                self.image = self.frames[self.frame_index]
-        if self.rect.bottom < 0 or self.rect.left > WIDTH or self.rect.right < 0:
-            self.kill()
+    @property
+    def velocity(self):
+        return (self.x_speed, self.y_speed)
+
+POWERUP_TYPES = ('shield', 'triple', 'bomb')
 
 class PowerUp(pygame.sprite.Sprite):
+    # Moved and culled by the ArrayGroup it belongs to
+    velocity = (0, 1)
+
     def __init__(self, powerup_type, x, y):
         super().__init__()
-        self.image = pygame.Surface((20, 20))
-        self.image.fill(YELLOW if powerup_type == 'shield' else PURPLE if powerup_type == 'triple' else RED)
+        self.image = atlas.image(f"powerup.{powerup_type}")
         self.rect = self.image.get_rect(center=(x, y))
         self.type = powerup_type
 
-    def update(self):
-        self.rect.y += 1
-        if self.rect.top > HEIGHT:
-            self.kill()
+class Explosion(PooledSprite):
+    # Aged and animated by the ArrayGroup it belongs to, one frame per animation tick
+    velocity = (0, 0)
+    frame_index = 0
+    animation_timer = 0
+    lifetime = EXPLOSION_FRAMES * ArrayGroup.frame_ticks
 
-class Explosion(pygame.sprite.Sprite):
     def __init__(self, pos):
         super().__init__()
-        self.image = pygame.Surface((20, 20))
-        self.image.fill(RED)
-        self.rect = self.image.get_rect(center=pos)
-        self.lifespan = 20
+        self.reset(pos)
 
-    def update(self):
-        self.lifespan -= 1
-        if self.lifespan <= 0:
-            self.kill()
+    def reset(self, pos):
+        self.frames = atlas.frames("explosion")
+        self.image = self.frames[0]
+        self.rect = self.image.get_rect(center=pos)
 
-class TextSprite(pygame.sprite.Sprite):
+class TextSprite(PooledSprite):
+    # Moved and aged by the ArrayGroup it belongs to
     def __init__(self, text, size, color, pos, duration, speed_y=0):
         super().__init__()
-        font = pygame.font.Font(None, size)
-        self.image = font.render(text, True, color)
+        self.reset(text, size, color, pos, duration, speed_y)
+
+    def reset(self, text, size, color, pos, duration, speed_y=0):
+        self.image = text_cache.render(text, size, color)
         self.rect = self.image.get_rect(center=pos)
-        self.duration = duration
-        self.speed_y = speed_y
+        self.lifetime = duration
+        self.velocity = (0, speed_y)
 
-    def update(self):
-        self.rect.y += self.speed_y
-        self.duration -= 1
-        if self.duration <= 0:
-            self.kill()
+bullet_pool = SpritePool(Bullet, max_free=256)
+enemy_pool = SpritePool(Enemy, max_free=128)
+explosion_pool = SpritePool(Explosion, max_free=128)
+text_pool = SpritePool(TextSprite, max_free=64)
+
+# ========== COLLISION BROADPHASE ==========
+class SpatialHash:
+    """Uniform grid broadphase for sprite-vs-group rect collisions.
+
+    rebuild() is called once per frame; each target group is then indexed
+    the first time it is queried, so sprites spawned earlier in the frame are
+    still found. Groups of up to SMALL sprites are not bucketed: a query tests
+    all their rects in one Rect.collidelistall() call. Larger groups are
+    bucketed by integer cell key and only the candidates sharing a cell with
+    the query are tested. Results match pygame.sprite.spritecollide/groupcollide,
+    including the order of the hit lists.
+    """
+    SMALL = 64
+    KEY_STRIDE = 1 << 16  # cell key = cx * KEY_STRIDE + cy; a clash only adds candidates
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self._indexes = {}
+
+    def rebuild(self):
+        self._indexes.clear()
+
+    def _index(self, group):
+        """(sprites, rects, buckets of sprite indexes or None) for `group`."""
+        index = self._indexes.get(group)
+        if index is None:
+            sprites = group.sprites()
+            rects = [sprite.rect for sprite in sprites]
+            buckets = None
+            if len(sprites) > self.SMALL:
+                buckets = {}
+                size, stride = self.cell_size, self.KEY_STRIDE
+                for i, rect in enumerate(rects):
+                    x0, y0 = rect.left // size, rect.top // size
+                    x1, y1 = (rect.right - 1) // size, (rect.bottom - 1) // size
+                    for cx in range(x0, x1 + 1):
+                        for key in range(cx * stride + y0, cx * stride + y1 + 1):
+                            bucket = buckets.get(key)
+                            if bucket is None:
+                                buckets[key] = [i]
+                            else:
+                                bucket.append(i)
+            index = self._indexes[group] = (sprites, rects, buckets)
+        return index
+
+    def _found(self, rect, rects, buckets):
+        """Indexes of the rects colliding with `rect`, in group order."""
+        if buckets is None:
+            return rect.collidelistall(rects)
+        size, stride = self.cell_size, self.KEY_STRIDE
+        x0, y0 = rect.left // size, rect.top // size
+        x1, y1 = (rect.right - 1) // size, (rect.bottom - 1) // size
+        if x0 == x1 and y0 == y1:
+            candidates = buckets.get(x0 * stride + y0)
+            if candidates is None:
+                return []
+        else:
+            found = set()
+            for cx in range(x0, x1 + 1):
+                for key in range(cx * stride + y0, cx * stride + y1 + 1):
+                    found.update(buckets.get(key, ()))
+            candidates = sorted(found)
+        return [candidates[i] for i in rect.collidelistall([rects[i] for i in candidates])]
+
+    def _hits(self, sprite, group, found, sprites, dokill, collided):
+        # Sprites killed since the group was indexed are skipped
+        hits = [sprites[i] for i in found]
+        hits = [other for other in hits if group.has(other) and (collided is None or collided(sprite, other))]
+        if dokill:
+            for other in hits:
+                other.kill()
+        return hits
+
+    def spritecollide(self, sprite, group, dokill, collided=None):
+        """Like pygame's: `collided(sprite, other)` is an exact test run only on rect hits."""
+        sprites, rects, buckets = self._index(group)
+        found = self._found(sprite.rect, rects, buckets)
+        return self._hits(sprite, group, found, sprites, dokill, collided) if found else []
+
+    def groupcollide(self, groupa, groupb, dokilla, dokillb, collided=None):
+        crashed = {}
+        sprites, rects, buckets = self._index(groupb)
+        found_in = self._found
+        for sprite in groupa.sprites():
+            found = found_in(sprite.rect, rects, buckets)
+            if not found:
+                continue
+            hits = self._hits(sprite, groupb, found, sprites, dokillb, collided)
+            if hits:
+                crashed[sprite] = hits
+                if dokilla:
+                    sprite.kill()
+        return crashed
+
+# ========== COLLISION MASKS ==========
+COLLISION_MODES = ("rect", "mask")
+
+class MaskCache:
+    """Collision masks built once per Surface and shared by every sprite showing it.
+
+    Surfaces are weak keys, so a mask goes away with its image. Images without
+    any transparent pixel (the JPEG photos) get the ellipse inscribed in their
+    rect instead, since the subjects are round and the corners are background.
+    """
+    def __init__(self):
+        self._masks = weakref.WeakKeyDictionary()
+        self.built = 0
+
+    def get(self, surface):
+        mask = self._masks.get(surface)
+        if mask is None:
+            mask = pygame.mask.from_surface(surface)
+            width, height = surface.get_size()
+            if mask.count() == width * height:
+                ellipse = pygame.Surface((width, height), pygame.SRCALPHA)
+                pygame.draw.ellipse(ellipse, WHITE, ellipse.get_rect())
+                mask = pygame.mask.from_surface(ellipse)
+            self._masks[surface] = mask
+            self.built += 1
+        return mask
+
+    def precompute(self):
+        """Build the masks of every collidable asset and bullet animation frame up front."""
+        for name in ("player", "enemy", "bullet"):
+            self.get(atlas.image(name))
+        for frame in atlas.frames("bullet") or ():
+            self.get(frame)
+
+mask_cache = MaskCache()
+
+def collide_masks(a, b):
+    """Pixel-exact test between two sprites whose rects already overlap."""
+    profiler.count("mask_tests")
+    rect_a, rect_b = a.rect, b.rect
+    return mask_cache.get(a.image).overlap(mask_cache.get(b.image),
+                                           (rect_b.x - rect_a.x, rect_b.y - rect_a.y)) is not None
 
 # ========== HELPER FUNCTIONS ==========
-def spawn_powerup(pos, powerup_group, all_sprites):
-    powerup_types = ['shield', 'triple', 'bomb']
-    weights = [0.4, 0.4, 0.2]
-    powerup_type = random.choices(powerup_types, weights=weights)[0]
+def spawn_powerup(pos, powerup_group, rng=random, weights=DEFAULT_BALANCE.powerup_weights):
+    powerup_type = rng.choices(POWERUP_TYPES, weights=weights)[0]
     
     powerup = PowerUp(powerup_type, pos[0], pos[1])
     powerup_group.add(powerup)
-    all_sprites.add(powerup)
     
-    for _ in range(10):
-        offset_x = random.randint(-20, 20)
-        offset_y = random.randint(-20, 20)
-        particle = Particle(
-            (pos[0] + offset_x, pos[1] + offset_y),
-            color=(255, 255, 0),
-            radius=2,
-            lifespan=20
-        )
-        all_sprites.add(particle)
-
-def render_text_with_shadow(text, font, color, shadow_color, pos, shadow_offset=(2, 2)):
-    shadow = font.render(text, True, shadow_color)
-    main_text = font.render(text, True, color)
-    screen.blit(shadow, (pos[0] + shadow_offset[0], pos[1] + shadow_offset[1]))
-    screen.blit(main_text, pos)
-
-def draw_bar(surface, x, y, width, height, value, max_value, color, bg_color=(50, 50, 50)):
-    pygame.draw.rect(surface, bg_color, (x, y, width, height))
+    particle_system.emit(pos, 10, color=(255, 255, 0), radius=(2, 2), lifespan=(20, 20), spread=20)
+
+def text_blit(text, size, color, shadow_color, pos, shadow_offset=(2, 2)):
+    image = text_cache.render(text, size, color, shadow_color, shadow_offset)
+    return image, (pos[0] + min(shadow_offset[0], 0), pos[1] + min(shadow_offset[1], 0))
+
+def render_text_with_shadow(text, size, color, shadow_color, pos, shadow_offset=(2, 2), surface=None):
+    if surface is None:
+        surface = screen
+    return surface.blit(*text_blit(text, size, color, shadow_color, pos, shadow_offset))
+
+# Pre-rendered shapes, keyed by (shape, size, colour, outline width)
+_stamps = {}
+
+def stamp(shape, size, color, width=0):
+    """A transparent surface of `size` holding one "circle" or "rect" that fills it,
+    drawn as an outline `width` pixels thick if width > 0, for blitting in place of pygame.draw."""
+    key = (shape, size, color, width)
+    image = _stamps.get(key)
+    if image is None:
+        image = _stamps[key] = pygame.Surface(size, pygame.SRCALPHA)
+        if shape == "circle":
+            pygame.draw.circle(image, color, (size[0] // 2, size[1] // 2), size[0] // 2, width)
+        else:
+            pygame.draw.rect(image, color, image.get_rect(), width)
+    return image
+
+def bar_blits(x, y, width, height, value, max_value, color, bg_color=(50, 50, 50)):
+    size = (width, height)
+    blits = [(stamp("rect", size, bg_color), (x, y))]
     if value > 0:
         fill_width = int(width * (value / max_value))
-        pygame.draw.rect(surface, color, (x, y, fill_width, height))
-    pygame.draw.rect(surface, (200, 200, 200), (x, y, width, height), 1)
+        blits.append((stamp("rect", size, color), (x, y), (0, 0, fill_width, height)))
+    blits.append((stamp("rect", size, (200, 200, 200), 1), (x, y)))
+    return blits
 
 def update_stars(stars_list):
     for star in stars_list:
@@ -384,22 +1631,133 @@ def update_stars(stars_list):
             star[1] = 0
             star[0] = random.randint(0, WIDTH)
 
+def star_blits(stars_list, dim=0, alpha=1.0):
+    """The stars as blits of circle stamps, their colour darkened by `dim`, `alpha`
+    of the way through their last update_stars() step."""
+    blits = []
+    for x, y, speed, radius, color in stars_list:
+        if dim:
+            color = tuple(max(0, c - dim) for c in color[:3])
+        y -= speed * (1 - alpha)
+        blits.append((stamp("circle", (radius * 2, radius * 2), color), (int(x) - radius, int(y) - radius)))
+    return blits
+
 def draw_stars(surface, stars_list):
-    for star in stars_list:
-        pygame.draw.circle(surface, star[4], (int(star[0]), int(star[1])), star[3])
+    surface.blits(star_blits(stars_list), doreturn=False)
+
+# ========== COMPOSITING LAYERS ==========
+class LayerStack:
+    """A screen built from ordered layers, where static layers are rendered once and cached.
+
+    Each layer is a draw(surface) function. A run of consecutive static layers
+    is composited into one cached surface the first time it is drawn: opaque
+    and full-screen when the run starts with an opaque layer, otherwise an
+    alpha surface cropped to what was drawn. It is only re-rendered after
+    add(). Dynamic layers draw straight onto the target every frame.
+    """
+    def __init__(self, size=(WIDTH, HEIGHT)):
+        self.size = size
+        self.layers = []
+        self._cache = {}  # index of the first layer of a static run -> (surface, pos)
+
+    def add(self, name, draw, static=True, opaque=False):
+        self.layers.append((name, draw, static, opaque))
+        self._cache.clear()
+        return self
+
+    def _render(self, run):
+        display = pygame.display.get_surface() is not None
+        if run[0][3]:
+            surface = pygame.Surface(self.size)
+            if display:
+                surface = surface.convert()
+        else:
+            surface = pygame.Surface(self.size, pygame.SRCALPHA)
+        for _, draw, _, _ in run:
+            draw(surface)
+        if run[0][3]:
+            return surface, (0, 0)
+        rect = surface.get_bounding_rect()
+        cropped = surface.subsurface(rect).copy()
+        return (cropped.convert_alpha() if display else cropped), rect.topleft
+
+    def draw(self, surface):
+        layers = self.layers
+        i = 0
+        while i < len(layers):
+            if not layers[i][2]:
+                layers[i][1](surface)
+                i += 1
+                continue
+            end = i
+            while end < len(layers) and layers[end][2]:
+                end += 1
+            cached = self._cache.get(i)
+            if cached is None:
+                cached = self._cache[i] = self._render(layers[i:end])
+            surface.blit(*cached)
+            i = end
+
+def draw_background(surface):
+    background_img = assets.image("background")
+    if background_img:
+        surface.blit(background_img, (0, 0))
+    else:
+        surface.fill((10, 10, 40))
+        draw_stars(surface, stars)
+
+def draw_centered_text(text, size, color, y):
+    """Shadowed text centred horizontally at height y, as a layer draw function."""
+    width = text_cache.font(size).size(text)[0]
+    return lambda surface: render_text_with_shadow(text, size, color, BLACK, (WIDTH // 2 - width // 2, y),
+                                                   surface=surface)
 
 def main_menu():
-    menu_font = pygame.font.Font(None, 64)
-    instruction_font = pygame.font.Font(None, 32)
+    title_width = text_cache.font(64).size("Strawberry Shooter")[0]
+    subtitle_width = text_cache.font(64).size("Birthday Edition")[0]
+    start_text = text_cache.render("Press ENTER to Start", 32, WHITE).copy()  # Private copy: its alpha pulses
     
-    title_text = menu_font.render("Strawberry Shooter", True, RED)
-    subtitle_text = menu_font.render("Birthday Edition", True, PINK)
-    start_text = instruction_font.render("Press ENTER to Start", True, WHITE)
-    controls_text = instruction_font.render("Arrow Keys: Move, SPACE: Shoot, B: Bomb", True, WHITE)
+    background_img = assets.image("background")
+    bullet_frames = atlas.frames("bullet")
     
     title_y = HEIGHT // 3
     title_direction = 0.5
     rotation = 0
+
+    # Each frame only shows for its own quarter turn; match bullet size in menu
+    spins = [transform_cache.precompute(frame, 50 / frame.get_width(), start=i * 90, stop=i * 90 + 90)
+             for i, frame in enumerate(bullet_frames or ())]
+
+    def draw_strawberries(surface):
+        if spins:
+            turn = spins[rotation // 90]
+            rotated_strawberry = turn[(rotation % 90) * len(turn) // 90]
+            surface.blit(rotated_strawberry, (50, 50))
+            surface.blit(rotated_strawberry, (WIDTH - 100, 50))
+            surface.blit(rotated_strawberry, (50, HEIGHT - 100))
+            surface.blit(rotated_strawberry, (WIDTH - 100, HEIGHT - 100))
+
+    def draw_titles(surface):
+        render_text_with_shadow("Strawberry Shooter", 64, RED, BLACK,
+                                (WIDTH // 2 - title_width // 2, title_y), surface=surface)
+        render_text_with_shadow("Birthday Edition", 64, PINK, BLACK,
+                                (WIDTH // 2 - subtitle_width // 2, title_y + 70), surface=surface)
+
+    def draw_start(surface):
+        pulse = (pygame.time.get_ticks() % 1000) / 1000
+        start_text.set_alpha(int(128 + 127 * math.sin(pulse * 2 * math.pi)))
+        surface.blit(start_text, (WIDTH // 2 - start_text.get_width() // 2, HEIGHT * 2 // 3))
+
+    controls = "Arrow Keys: Move, SPACE: Shoot, B: Bomb"
+    controls_width = text_cache.font(32).size(controls)[0]
+    # The starfield fallback moves, so only a background image can be cached
+    layers = LayerStack()
+    layers.add("background", draw_background, static=bool(background_img), opaque=True)
+    layers.add("controls", lambda surface: surface.blit(text_cache.render(controls, 32, WHITE),
+                                                        (WIDTH // 2 - controls_width // 2, HEIGHT * 2 // 3 + 50)))
+    layers.add("strawberries", draw_strawberries, static=False)
+    layers.add("titles", draw_titles, static=False)
+    layers.add("start", draw_start, static=False)
     
     running = True
     while running:
@@ -423,94 +1781,78 @@ def main_menu():
             
         rotation = (rotation + 1) % 360
         
-        if background_img:
-            screen.blit(background_img, (0, 0))
-        else:
-            screen.fill((10, 10, 40))
-            draw_stars(screen, stars)
-            
-        if bullet_frames:
-            strawberry = bullet_frames[rotation // 90]
-            scaled_strawberry = pygame.transform.scale(strawberry, (50, 50))  # Match bullet size in menu
-            rotated_strawberry = pygame.transform.rotate(scaled_strawberry, rotation)
-            screen.blit(rotated_strawberry, (50, 50))
-            screen.blit(rotated_strawberry, (WIDTH - 100, 50))
-            screen.blit(rotated_strawberry, (50, HEIGHT - 100))
-            screen.blit(rotated_strawberry, (WIDTH - 100, HEIGHT - 100))
-        
-        render_text_with_shadow("Strawberry Shooter", menu_font, RED, BLACK, 
-                               (WIDTH // 2 - title_text.get_width() // 2, title_y))
-        render_text_with_shadow("Birthday Edition", menu_font, PINK, BLACK, 
-                               (WIDTH // 2 - subtitle_text.get_width() // 2, title_y + 70))
-                               
-        pulse = (pygame.time.get_ticks() % 1000) / 1000
-        alpha = int(128 + 127 * math.sin(pulse * 2 * math.pi))
-        start_text_copy = start_text.copy()
-        start_text_copy.set_alpha(alpha)
-        screen.blit(start_text_copy, (WIDTH // 2 - start_text.get_width() // 2, HEIGHT * 2 // 3))
-        
-        screen.blit(controls_text, (WIDTH // 2 - controls_text.get_width() // 2, HEIGHT * 2 // 3 + 50))
-        
+        layers.draw(screen)
         pygame.display.flip()
 
+_pause_layers = None
+
 def pause_game():
-    pause_font = pygame.font.Font(None, 48)
-    instruction_font = pygame.font.Font(None, 36)
-    
-    pause_text = pause_font.render("GAME PAUSED", True, WHITE)
-    continue_text = instruction_font.render("Press P to Continue", True, WHITE)
-    quit_text = instruction_font.render("Press ESC to Quit", True, WHITE)
+    global _pause_layers
+    if _pause_layers is None:
+        _pause_layers = LayerStack()
+        _pause_layers.add("dim", lambda surface: surface.fill((0, 0, 0, 128)))
+        _pause_layers.add("title", draw_centered_text("GAME PAUSED", 48, WHITE, HEIGHT // 2 - 50))
+        _pause_layers.add("continue", draw_centered_text("Press P to Continue", 36, WHITE, HEIGHT // 2 + 20))
+        _pause_layers.add("quit", draw_centered_text("Press ESC to Quit", 36, WHITE, HEIGHT // 2 + 70))
     
-    overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-    overlay.fill((0, 0, 0, 128))
+    # Nothing moves while paused: draw the overlay once and block on input
+    _pause_layers.draw(screen)
+    pygame.display.flip()
     
     running = True
     while running:
-        clock.tick(60)
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_p:
-                    return PLAYING
-                elif event.key == pygame.K_ESCAPE:
-                    return MENU
-        
-        screen.blit(overlay, (0, 0))
-        
-        render_text_with_shadow("GAME PAUSED", pause_font, WHITE, BLACK, 
-                               (WIDTH // 2 - pause_text.get_width() // 2, HEIGHT // 2 - 50))
-        render_text_with_shadow("Press P to Continue", instruction_font, WHITE, BLACK, 
-                               (WIDTH // 2 - continue_text.get_width() // 2, HEIGHT // 2 + 20))
-        render_text_with_shadow("Press ESC to Quit", instruction_font, WHITE, BLACK, 
-                               (WIDTH // 2 - quit_text.get_width() // 2, HEIGHT // 2 + 70))
-        
-        pygame.display.flip()
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT:
+            pygame.quit()
+            sys.exit()
+        elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_p:
+                return PLAYING
+            elif event.key == pygame.K_ESCAPE:
+                return MENU
+
+def draw_darkened_background(surface):
+    background_img = assets.image("background")
+    if background_img:
+        surface.blit(background_img, (0, 0))
+        dark_overlay = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+        dark_overlay.fill((0, 0, 0, 150))
+        surface.blit(dark_overlay, (0, 0))
+    else:
+        surface.fill((10, 10, 40))
+        surface.blits(star_blits(stars, dim=100), doreturn=False)
 
 def game_over_screen(final_score, high_score):
-    font_large = pygame.font.Font(None, 64)
-    font_medium = pygame.font.Font(None, 48)
-    font_small = pygame.font.Font(None, 36)
-    
-    game_over_text = font_large.render("GAME OVER", True, RED)
-    restart_text = font_medium.render("Press R to Restart", True, WHITE)
-    quit_text = font_medium.render("Press Q to Quit", True, WHITE)
-    score_text = font_medium.render(f"Final Score: {final_score}", True, WHITE)
-    
     is_new_high_score = final_score > high_score
     if is_new_high_score:
         high_score = final_score
-        high_score_text = font_medium.render("NEW HIGH SCORE!", True, YELLOW)
+        high_score_text = text_cache.render("NEW HIGH SCORE!", 48, YELLOW)
     else:
-        high_score_text = font_medium.render(f"High Score: {high_score}", True, WHITE)
+        high_score_text = text_cache.render(f"High Score: {high_score}", 48, WHITE)
     
-    particles = pygame.sprite.Group()
+    particle_system.clear()
     for _ in range(50):
         pos = (WIDTH // 2, HEIGHT // 2)
         color = (random.randint(150, 255), random.randint(0, 100), random.randint(0, 100))
-        particle = Particle(pos, color=color, radius=random.randint(2, 5), lifespan=random.randint(60, 120))
-        particles.add(particle)
+        particle_system.emit(pos, 1, color=color, radius=(2, 5), lifespan=(60, 120))
+
+    def draw_high_score(surface):
+        image = high_score_text
+        if is_new_high_score:
+            pulse = (pygame.time.get_ticks() % 1000) / 1000
+            scale_factor = 1.0 + 0.1 * math.sin(pulse * 2 * math.pi)
+            image = transform_cache.get(high_score_text, scale=scale_factor)
+        surface.blit(image, (WIDTH // 2 - image.get_width() // 2, HEIGHT // 2 + 40))
+
+    # Everything but the confetti and the pulsing high score is drawn once
+    layers = LayerStack()
+    layers.add("background", draw_darkened_background, opaque=True)
+    layers.add("title", draw_centered_text("GAME OVER", 64, RED, HEIGHT // 3))
+    layers.add("score", draw_centered_text(f"Final Score: {final_score}", 48, WHITE, HEIGHT // 2 - 20))
+    layers.add("restart", draw_centered_text("Press R to Restart", 36, WHITE, HEIGHT * 3 // 4))
+    layers.add("quit", draw_centered_text("Press Q to Quit", 36, WHITE, HEIGHT * 3 // 4 + 50))
+    layers.add("particles", lambda surface: surface.blits(particle_system.blits(), doreturn=False), static=False)
+    layers.add("high_score", draw_high_score, static=not is_new_high_score)
     
     running = True
     while running:
@@ -525,115 +1867,956 @@ def game_over_screen(final_score, high_score):
                 if event.key == pygame.K_q or event.key == pygame.K_ESCAPE:
                     return MENU, high_score
         
-        particles.update()
+        particle_system.update()
         if random.random() < 0.1:
             pos = (random.randint(0, WIDTH), random.randint(0, HEIGHT))
             color = (random.randint(150, 255), random.randint(0, 100), random.randint(0, 100))
-            particle = Particle(pos, color=color, radius=random.randint(2, 4), lifespan=random.randint(30, 60))
-            particles.add(particle)
+            particle_system.emit(pos, 1, color=color, radius=(2, 4), lifespan=(30, 60))
         
+        layers.draw(screen)
+        pygame.display.flip()
+
+def create_enemy_wave(enemy_group, count, score, rng=random, balance=DEFAULT_BALANCE,
+                      archetype=DEFAULT_ARCHETYPE, positions=None):
+    for pos in positions or [None] * count:
+        enemy_pool.acquire((enemy_group,), score, rng, balance, archetype, pos)
+
+# ========== WAVES ==========
+# A wave file declares enemy archetypes, named formations, the intro spawns of
+# a game and one wave per level range:
+#
+#   {"archetypes": {"diver": {"speed_min": 1.5, "speed_max": 2.5}},
+#    "formations": {"wide_v": {"shape": "v", "spacing": 70}},
+#    "intro": [{"at": 0, "count": 3}],
+#    "start": 90,
+#    "waves": [{"level": 1, "length": 90, "events": [{"at": 0, "count": 1}]},
+#              {"level": 4, "length": 240, "events": [{"at": 60, "count": 5, "formation": "wide_v",
+#                                                      "archetype": "diver"}]}]}
+#
+# A wave is a timeline of `length` frames that loops, from frame `start` of the
+# game on (0 when omitted); each loop uses the wave of the level current when
+# it starts (the last wave whose level is <= it).
+# Events spawn `count` enemies `at` frames into the loop. Formations are a
+# built-in shape with a spacing; events may name a shape directly and set
+# "spacing" and "x" (the formation centre, random when omitted).
+WAVE_SHAPES = ("random", "line", "v", "column")
+WAVE_DEFAULT_SPACING = 60
+
+SpawnEvent = namedtuple("SpawnEvent", ["at", "count", "archetype", "shape", "spacing", "x"])
+Wave = namedtuple("Wave", ["level", "length", "events"])
+
+def default_waves(balance=DEFAULT_BALANCE):
+    """The classic endless schedule as wave data, tuned by the Balance fields.
+
+    Like the original loop, the first drop comes spawn_interval frames in and
+    each drop's size, and the wait until the next one, follow the level at the
+    time of the drop: every loop drops at its start.
+    """
+    waves = []
+    level = 1
+    while True:
+        length = max(balance.min_spawn_interval,
+                     balance.spawn_interval - level * balance.spawn_interval_per_level)
+        count = min(1 + level // 2, 5)
+        if not waves or (waves[-1]["length"], waves[-1]["events"][0]["count"]) != (length, count):
+            waves.append({"level": level, "length": length, "events": [{"at": 0, "count": count}]})
+        if count == 5 and (length == balance.min_spawn_interval or balance.spawn_interval_per_level <= 0):
+            break
+        level += 1
+    return {"intro": [{"at": 0, "count": 3}], "start": balance.spawn_interval, "waves": waves}
+
+def load_waves(path):
+    """Read and compile a wave file (.json, or .toml on Python 3.11+)."""
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError(f"{path}: TOML wave files need Python 3.11 or newer")
+        with open(path, "rb") as f:
+            return WaveSchedule(tomllib.load(f), path)
+    with open(path) as f:
+        return WaveSchedule(json.load(f), path)
+
+class WaveSchedule:
+    """Validated, precompiled wave data: each wave's events sorted by time.
+
+    Raises ValueError naming the offending entry for malformed data.
+    """
+    def __init__(self, data, source="<waves>"):
+        self.source = source
+        self.archetypes = {"default": DEFAULT_ARCHETYPE}
+        for name, spec in data.get("archetypes", {}).items():
+            self._check_keys(spec, Archetype._fields, f"archetypes.{name}")
+            self.archetypes[name] = Archetype(**spec)
+            for field, value in zip(Archetype._fields, self.archetypes[name]):
+                if value is not None and (not isinstance(value, (int, float)) or value < 0):
+                    self._fail(f"archetypes.{name}.{field}", "must be a non-negative number")
+        self.formations = {shape: (shape, WAVE_DEFAULT_SPACING) for shape in WAVE_SHAPES}
+        for name, spec in data.get("formations", {}).items():
+            self._check_keys(spec, ("shape", "spacing"), f"formations.{name}")
+            if spec.get("shape") not in WAVE_SHAPES:
+                self._fail(f"formations.{name}.shape", f"must be one of {', '.join(WAVE_SHAPES)}")
+            self.formations[name] = (spec["shape"], spec.get("spacing", WAVE_DEFAULT_SPACING))
+
+        self.intro = self._compile_events(data.get("intro", []), math.inf, "intro")
+        self.start = data.get("start", 0)
+        if not isinstance(self.start, (int, float)) or self.start < 0:
+            self._fail("start", "must be a number of frames >= 0")
+        waves = data.get("waves")
+        if not waves:
+            self._fail("waves", "needs at least one wave")
+        self.waves = []
+        for i, spec in enumerate(waves):
+            where = f"waves[{i}]"
+            self._check_keys(spec, Wave._fields, where)
+            level, length = spec.get("level", 1), spec.get("length")
+            if not isinstance(level, int) or level < 1:
+                self._fail(f"{where}.level", "must be an integer >= 1")
+            if not isinstance(length, (int, float)) or length < 1:
+                self._fail(f"{where}.length", "must be a number of frames >= 1")
+            self.waves.append(Wave(level, length, self._compile_events(spec.get("events", []), length, where)))
+        self.waves.sort(key=lambda wave: wave.level)
+        self.levels = [wave.level for wave in self.waves]
+        if self.levels[0] != 1:
+            self._fail("waves", "the first wave must start at level 1")
+        if len(set(self.levels)) != len(self.levels):
+            self._fail("waves", "two waves start at the same level")
+
+    def _fail(self, where, message):
+        raise ValueError(f"{self.source}: {where}: {message}")
+
+    def _check_keys(self, spec, allowed, where):
+        if not isinstance(spec, dict):
+            self._fail(where, "must be a table/object")
+        unknown = set(spec) - set(allowed)
+        if unknown:
+            self._fail(where, f"unknown field(s) {', '.join(sorted(unknown))}")
+
+    def _compile_events(self, specs, length, where):
+        events = []
+        for i, spec in enumerate(specs):
+            here = f"{where}.events[{i}]" if where != "intro" else f"intro[{i}]"
+            self._check_keys(spec, ("at", "count", "archetype", "formation", "spacing", "x"), here)
+            at, count = spec.get("at", 0), spec.get("count", 1)
+            if not isinstance(at, (int, float)) or not 0 <= at <= length:
+                self._fail(f"{here}.at", "must be a frame within the wave")
+            if not isinstance(count, int) or count < 1:
+                self._fail(f"{here}.count", "must be an integer >= 1")
+            archetype = self.archetypes.get(spec.get("archetype", "default"))
+            if archetype is None:
+                self._fail(f"{here}.archetype", f"unknown archetype {spec['archetype']!r}")
+            formation = self.formations.get(spec.get("formation", "random"))
+            if formation is None:
+                self._fail(f"{here}.formation", f"unknown formation {spec['formation']!r}")
+            shape, spacing = formation
+            events.append(SpawnEvent(at, count, archetype, shape, spec.get("spacing", spacing), spec.get("x")))
+        events.sort(key=lambda event: event.at)  # stable, so ties keep file order
+        return tuple(events)
+
+    def wave_index(self, level):
+        return bisect.bisect_right(self.levels, level) - 1
+
+def formation_positions(event, rng=random):
+    """Midbottom spawn points for an event's enemies; None lets Enemy pick a random x."""
+    if event.shape == "random":
+        return [None] * event.count
+    offsets = [i - (event.count - 1) / 2 for i in range(event.count)]
+    x = event.x
+    if x is None:
+        half_width = 0 if event.shape == "column" else offsets[-1] * event.spacing
+        low, high = 20 + half_width, WIDTH - 20 - half_width
+        x = rng.randint(int(low), int(high)) if low <= high else WIDTH // 2
+    if event.shape == "column":
+        points = [(x, -i * event.spacing) for i in range(event.count)]
+    elif event.shape == "v":
+        points = [(x + offset * event.spacing, -abs(offset) * event.spacing) for offset in offsets]
+    else:
+        points = [(x + offset * event.spacing, 0) for offset in offsets]
+    return [(min(max(round(px), 20), WIDTH - 20), round(py)) for px, py in points]
+
+class WaveScheduler:
+    """Runs a WaveSchedule: due spawn events wait in a heap keyed by frame, so
+    each step only pops the events that are due."""
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.queue = []
+        self.order = itertools.count()
+        self.index = 0
+        self.start = 0
+
+    def reset(self):
+        self.resume(0, self.schedule.start, -1)
+
+    def resume(self, index, start, frame):
+        """Rebuild the queue for the loop of wave `index` begun at `start`, as it
+        stands after `frame` (events due by then have already fired)."""
+        self.queue = []
+        self.order = itertools.count()
+        for event in self.schedule.intro:
+            if event.at > frame:
+                self._push(event.at, event)
+        self.index, self.start = index, start
+        for event in self.schedule.waves[index].events:
+            if start + event.at > frame:
+                self._push(start + event.at, event)
+
+    def _push(self, due, event):
+        heapq.heappush(self.queue, (due, next(self.order), event))
+
+    def due(self, frame, level):
+        """Pop the events due by `frame`, starting new loops of the level's wave as they come up."""
+        events = []
+        queue = self.queue
+        while True:
+            while queue and queue[0][0] <= frame:
+                events.append(heapq.heappop(queue)[2])
+            end = self.start + self.schedule.waves[self.index].length
+            if frame < end:
+                return events
+            self.index, self.start = self.schedule.wave_index(level), end
+            for event in self.schedule.waves[self.index].events:
+                self._push(end + event.at, event)
+
+# ========== ENTITY REGISTRY ==========
+# Draw order, back to front
+ENTITY_LAYERS = ("effects", "powerups", "enemies", "boss", "bullets", "enemy_bullets", "player", "text")
+
+def group_blits(group):
+    """Blits function for a sprite group: atlas images are blitted from the atlas sheet by area."""
+    def blits(alpha):
+        sheet, areas = atlas.sheet, atlas.areas
+        blits = []
+        for sprite in group:
+            area = areas.get(sprite.image)
+            blits.append((sheet, sprite.rect, area) if area else (sprite.image, sprite.rect))
+        return blits
+    return blits
+
+def stepped_blits(group):
+    """Blits function for a group of SteppedSprites, drawn `alpha` of the way through the step."""
+    def blits(alpha):
+        sheet, areas = atlas.sheet, atlas.areas
+        blits = []
+        for sprite in group:
+            area = areas.get(sprite.image)
+            rect = sprite.lerp_rect(alpha)
+            blits.append((sheet, rect, area) if area else (sprite.image, rect))
+        return blits
+    return blits
+
+class EntityRegistry:
+    """A world's entity containers indexed by kind: sprite groups and array stores.
+
+    Entities live only in the container of their kind, so adding or removing
+    one is that container's own O(1) bookkeeping and nothing is mirrored into a
+    catch-all group. update() runs each kind's update in registration order,
+    submit() queues each kind's blits on its layer of a RenderQueue and
+    counts() is a len() per kind.
+    """
+    def __init__(self, layers=ENTITY_LAYERS):
+        self.layers = layers
+        self.kinds = {}
+        self._updates = []
+        self._blits = {}
+
+    def register(self, kind, container, update=True, blits=None):
+        """Add a kind, updated by container.update() unless `update` is False.
+        `blits(alpha)` returns the kind's blits; it defaults to those of a sprite group."""
+        if kind not in self.layers:
+            raise ValueError(f"kind {kind!r} has no draw layer")
+        self.kinds[kind] = container
+        if update:
+            self._updates.append(container.update)
+        self._blits[kind] = blits or group_blits(container)
+
+    def __len__(self):
+        return sum(len(container) for container in self.kinds.values())
+
+    def counts(self):
+        return {kind: len(container) for kind, container in self.kinds.items()}
+
+    def update(self):
+        for update in self._updates:
+            update()
+
+    def submit(self, queue, alpha=1.0):
+        """Queue every kind's blits on the render layer of the same name."""
+        for kind, blits in self._blits.items():
+            queue.extend(kind, blits(alpha))
+
+    def clear(self):
+        """Remove every entity; sprites are kill()ed so pooled ones go back to their pools."""
+        for container in self.kinds.values():
+            if isinstance(container, pygame.sprite.AbstractGroup):
+                for sprite in container.sprites():
+                    sprite.kill()
+                container.empty()
+            else:
+                container.clear()
+
+# ========== RENDER QUEUE ==========
+# Draw order, back to front; the entity kinds keep their own layer names
+RENDER_LAYERS = ("background",) + ENTITY_LAYERS + ("particles", "hud")
+
+class RenderQueue:
+    """Blits submitted during a frame and drawn by a single Surface.blits() call.
+
+    Commands are (source, dest) or (source, dest, area) tuples as taken by
+    Surface.blits(). flush() draws the layers in order and, within a layer,
+    all of one source surface's commands together, sources in the order they
+    were first submitted; each source keeps its own submission order, so only
+    overlapping blits of different sources on one layer can restack. Atlas
+    sprites all share the atlas sheet. `counts` holds the commands per layer
+    of the last flush.
+    """
+    def __init__(self, layers=RENDER_LAYERS):
+        self.layers = layers
+        self._queued = {layer: {} for layer in layers}
+        self.counts = {}
+
+    def submit(self, layer, source, dest, area=None):
+        self.extend(layer, [(source, dest) if area is None else (source, dest, area)])
+
+    def extend(self, layer, commands):
+        by_source = self._queued[layer]
+        for command in commands:
+            queued = by_source.get(command[0])
+            if queued is None:
+                by_source[command[0]] = [command]
+            else:
+                queued.append(command)
+
+    def __len__(self):
+        return sum(len(commands) for by_source in self._queued.values() for commands in by_source.values())
+
+    def flush(self, surface, doreturn=False):
+        """Draw and empty the queue; returns the rects drawn, in draw order, if `doreturn` is set."""
+        sequence = []
+        counts = {}
+        sources = 0
+        for layer, by_source in self._queued.items():
+            if by_source:
+                start = len(sequence)
+                for commands in by_source.values():
+                    sequence += commands
+                counts[layer] = len(sequence) - start
+                sources += len(by_source)
+                by_source.clear()
+        self.counts = counts
+        profiler.count("blits", len(sequence))
+        profiler.count("blit_sources", sources)
+        rects = surface.blits(sequence, doreturn=doreturn)
+        return rects if doreturn else []
+
+render_queue = RenderQueue()
+
+# ========== GAME WORLD ==========
+FRAME_MS = 1000 / 60
+
+# One simulation step's worth of player input
+FrameInput = namedtuple("FrameInput", ["left", "right", "fire", "bomb"], defaults=(False, False, False, False))
+
+def read_input(keys_pressed, bomb=False):
+    return FrameInput(keys_pressed[pygame.K_LEFT], keys_pressed[pygame.K_RIGHT],
+                      keys_pressed[pygame.K_SPACE], bomb)
+
+class FixedStepClock:
+    """Game clock that advances by a fixed step per simulated frame.
+
+    Anything with get_ticks() can be injected instead (pygame.time included).
+    """
+    def __init__(self, step_ms=FRAME_MS):
+        self.step_ms = step_ms
+        self.frame = 0
+
+    def tick(self):
+        self.frame += 1
+
+    def get_ticks(self):
+        return int(self.frame * self.step_ms)
+
+    def reset(self):
+        self.frame = 0
+
+PLAYER_HITBOX_SHRINK = 30  # px taken off the player's width and height for enemy bullets
+
+# Throwaway RNG for rebuilding pooled enemies whose state is then overwritten
+_restore_rng = random.Random(0)
+
+class GameWorld:
+    """The game simulation, one fixed frame per step(), with no display or input device.
+
+    All gameplay randomness comes from a seeded RNG and all timing from the
+    injected clock, so the same seed and inputs always play the same game.
+    Enemies arrive on the `waves` schedule (a WaveSchedule), by default the
+    classic endless one built from `balance`. With collision="mask", sprites
+    whose rects overlap only collide if their pixels do (see MaskCache).
+    """
+    def __init__(self, seed=None, clock=None, particles=None, balance=DEFAULT_BALANCE, audio=None, waves=None,
+                 collision="rect"):
+        if collision not in COLLISION_MODES:
+            raise ValueError(f"unknown collision mode {collision!r}")
+        self.collided = collide_masks if collision == "mask" else None
+        if self.collided:
+            mask_cache.precompute()
+        self.balance = balance
+        self.waves = WaveScheduler(waves or WaveSchedule(default_waves(balance)))
+        self.clock = clock if clock is not None else FixedStepClock()
+        self.particles = particles if particles is not None else particle_system
+        self.audio = audio if audio is not None else audio_manager
+        self.player_group = pygame.sprite.GroupSingle()
+        self.enemy_group = ArrayGroup(bounds=(-math.inf, -math.inf, math.inf, HEIGHT))
+        self.boss_group = pygame.sprite.GroupSingle()
+        self.player_bullet_group = ArrayGroup(bounds=(0, 0, WIDTH, math.inf))
+        self.enemy_bullets = EnemyBullets()
+        self.powerup_group = ArrayGroup(bounds=(-math.inf, -math.inf, math.inf, HEIGHT))
+        self.text_group = ArrayGroup()
+        self.effect_group = ArrayGroup()
+        self.moving_groups = (self.enemy_group, self.player_bullet_group, self.powerup_group,
+                              self.text_group, self.effect_group)
+        # Registered in update order; the player is updated on its own, with the input
+        self.entities = EntityRegistry()
+        for group, kind in ((self.enemy_group, "enemies"), (self.player_bullet_group, "bullets"),
+                            (self.powerup_group, "powerups"), (self.text_group, "text"),
+                            (self.effect_group, "effects")):
+            self.entities.register(kind, group)
+        self.entities.register("boss", self.boss_group, blits=stepped_blits(self.boss_group))
+        self.entities.register("enemy_bullets", self.enemy_bullets, blits=self.enemy_bullets.blits)
+        self.entities.register("player", self.player_group, update=False, blits=stepped_blits(self.player_group))
+        self.collision_grid = SpatialHash()
+        self.seed = seed
+        self.reset()
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed = seed
+        self.rng = random.Random(self.seed)
+        # A reset world must play exactly like a new one, clock included
+        clock_reset = getattr(self.clock, "reset", None)
+        if clock_reset:
+            clock_reset()
+        self.particles.reseed(self.seed)
+        self.particles.clear()
+        self.entities.clear()
+
+        self.frame = 0
+        self.score = 0
+        self.level = 1
+        self.next_boss_score = self.balance.boss_level_interval
+        self.has_boss = False
+        self.waves.reset()
+        self.combo_count = 0
+        self.combo_timer = 0
+        self.peak_combo = 0
+        self.game_over = False
+        self.audio.reset()
+
+        self.player = Player(self.clock)
+        self.player_group.add(self.player)
+        self.add_text("Get Ready!", 72, YELLOW, (WIDTH // 2, HEIGHT // 2), duration=120, speed_y=-0.5)
+        self.spawn_due()
+
+    def snapshot(self):
+        """Capture the gameplay state as plain data (no Surfaces) for restore().
+
+        Entities keep their group order, which decides collision order. Floating
+        text, explosions and particles are cosmetic and are not captured; enemy
+        bullets are.
+        """
+        player = self.player_group.sprite
+        boss = self.boss_group.sprite
+        return {
+            "seed": self.seed,
+            "rng": self.rng.getstate(),
+            "clock": getattr(self.clock, "frame", None),
+            "frame": self.frame,
+            "score": self.score,
+            "level": self.level,
+            "next_boss_score": self.next_boss_score,
+            "has_boss": self.has_boss,
+            "wave": self.waves.index,
+            "wave_start": self.waves.start,
+            "combo_count": self.combo_count,
+            "combo_timer": self.combo_timer,
+            "peak_combo": self.peak_combo,
+            "game_over": self.game_over,
+            "player": player and (player.rect.x, player.rect.y, player.lives, player.bombs,
+                                  player.shield_active, player.shield_timer, player.shield_duration,
+                                  player.triple_shot, player.triple_shot_timer,
+                                  player.triple_shot_duration, player.last_shot_time),
+            "enemies": [self.enemy_group.position(e) + (e.speed,) for e in self.enemy_group],
+            "bullets": [self.player_bullet_group.position(b) + (b.x_speed, b.y_speed) +
+                        self.player_bullet_group.anim_state(b) for b in self.player_bullet_group],
+            "powerups": [(p.type,) + self.powerup_group.position(p) for p in self.powerup_group],
+            "boss": boss and (boss.rect.x, boss.rect.y, boss.health, boss.max_health, boss.timer,
+                              boss.direction),
+            "enemy_bullets": self.enemy_bullets.state(),
+        }
+
+    def restore(self, state):
+        """Put the world back into a state captured by snapshot()."""
+        self.entities.clear()
+        self.particles.clear()
+        self.seed = state["seed"]
+        self.rng.setstate(state["rng"])
+        if state["clock"] is not None:
+            self.clock.frame = state["clock"]
+        for name in ("frame", "score", "level", "next_boss_score", "has_boss", "combo_count",
+                     "combo_timer", "peak_combo", "game_over"):
+            setattr(self, name, state[name])
+        self.waves.resume(state["wave"], state["wave_start"], self.frame)
+
+        self.player = None
+        if state["player"]:
+            player = self.player = Player(self.clock)
+            (player.rect.x, player.rect.y, player.lives, player.bombs, player.shield_active,
+             player.shield_timer, player.shield_duration, player.triple_shot, player.triple_shot_timer,
+             player.triple_shot_duration, player.last_shot_time) = state["player"]
+            player.settle()
+            self.player_group.add(player)
+        if state["boss"]:
+            x, y, health, max_health, timer, direction = state["boss"]
+            boss = Boss(max_health)
+            boss.rect.topleft = (x, y)
+            boss.settle()
+            boss.health = health
+            boss.timer = timer
+            boss.direction = direction
+            self.boss_group.add(boss)
+        # Array groups read velocity and animation on add, so set them first
+        for x, y, speed in state["enemies"]:
+            enemy = enemy_pool.acquire((), 0, _restore_rng)
+            enemy.speed = speed
+            enemy.add(self.enemy_group)
+            self.enemy_group.place(enemy, x, y)
+        for x, y, x_speed, y_speed, frame_index, animation_timer in state["bullets"]:
+            bullet = bullet_pool.acquire((), 0, 0, x_speed, y_speed)
+            bullet.animation_timer = animation_timer
+            if bullet.frames:
+                bullet.frame_index = frame_index
+                bullet.image = bullet.frames[frame_index]
+            bullet.add(self.player_bullet_group)
+            self.player_bullet_group.place(bullet, x, y)
+        for powerup_type, x, y in state["powerups"]:
+            powerup = PowerUp(powerup_type, 0, 0)
+            self.powerup_group.add(powerup)
+            self.powerup_group.place(powerup, x, y)
+        self.enemy_bullets.load(state["enemy_bullets"])
+
+    def save_state(self):
+        """snapshot() packed into the compact binary format of pack_snapshot()."""
+        return pack_snapshot(self.snapshot())
+
+    def load_state(self, data):
+        """Restore a state written by save_state()."""
+        self.restore(unpack_snapshot(data))
+
+    def add_text(self, text, size, color, pos, duration, speed_y=0):
+        text_pool.acquire((self.text_group,), text, size, color, pos,
+                          duration=duration, speed_y=speed_y)
+
+    def play_sound(self, name):
+        self.audio.play(name, self.clock.get_ticks())
+
+    def spawn_due(self):
+        for event in self.waves.due(self.frame, self.level):
+            create_enemy_wave(self.enemy_group, event.count, self.score, self.rng, self.balance,
+                              event.archetype, formation_positions(event, self.rng))
+
+    def step(self, inputs):
+        """Advance the game by one frame. Sets game_over when the player runs out of lives."""
+        if self.game_over:
+            return
+        self.frame += 1
+        self.clock.tick()
+        player = self.player_group.sprite
+
+        if inputs.bomb and player and player.use_bomb(self.enemy_group, self.boss_group):
+            self.add_text("BOMB USED!", 48, RED, (WIDTH // 2, HEIGHT // 2), duration=60, speed_y=-1)
+            self.enemy_bullets.clear()
+            self.play_sound("enemy_die")
+
+        if player:
+            if player.update(inputs):
+                if player.shoot(self.player_bullet_group):
+                    self.play_sound("shoot")
+        profiler.mark("player")
+
+        self.spawn_due()
+
+        if self.combo_count > 0:
+            self.combo_timer += 1
+            if self.combo_timer > 60:
+                self.combo_count = 0
+                self.combo_timer = 0
+
+        profiler.mark("spawn")
+
+        self.entities.update()
+        profiler.mark("update")
+        self.particles.update()
+        profiler.mark("particles")
+
+        boss = self.boss_group.sprite
+        if boss:
+            boss.shoot(self.enemy_bullets, self.player_group.sprite)
+
+        if self.score >= self.next_boss_score and not self.has_boss:
+            boss = Boss(health=100 + self.level * 20)
+            self.boss_group.add(boss)
+            self.has_boss = True
+            self.add_text("BOSS INCOMING!", 64, RED, (WIDTH // 2, HEIGHT // 2), duration=120, speed_y=0)
+            self.next_boss_score += self.balance.boss_level_interval + (self.level * 100)
+
+        # Float positions reach the rects in one batched pass, before collisions and drawing
+        for group in self.moving_groups:
+            group.sync()
+        self.handle_collisions()
+        profiler.mark("collisions")
+
+    def sprite_counts(self):
+        counts = self.entities.counts()
+        counts["all"] = sum(counts.values())
+        counts["particles"] = len(self.particles)
+        return counts
+
+    def run_stats(self):
+        """This game's stats so far, for the leaderboard."""
+        return RunStats(self.score, self.level, self.frame / 60, self.peak_combo, self.seed)
+
+    def handle_collisions(self):
+        rng = self.rng
+        grid = self.collision_grid
+
+        # Collision detection: Player bullets vs. enemies
+        grid.rebuild()
+        hits = grid.groupcollide(self.player_bullet_group, self.enemy_group, True, False, self.collided)
+        for bullet, enemies in hits.items():
+            for enemy in enemies:
+                if enemy.take_damage():
+                    enemy.kill()
+                    profiler.count("enemy_kills")
+                    self.play_sound("enemy_die")
+                    self.particles.emit(enemy.rect.center, 10, PINK, radius=(2, 5), lifespan=(20, 40))
+
+                    self.combo_count += 1
+                    self.combo_timer = 0
+                    self.peak_combo = max(self.peak_combo, self.combo_count)
+                    score_add = 10 * (1 + min(self.combo_count // 5, 4))
+                    self.score += score_add
+                    self.add_text(f"+{score_add}", 24, WHITE, enemy.rect.center, duration=30, speed_y=-1)
+
+                    if self.combo_count % 5 == 0 and self.combo_count > 0:
+                        self.add_text(f"{self.combo_count} COMBO!", 36, YELLOW,
+                                      (WIDTH // 2, HEIGHT // 3), duration=60, speed_y=-1)
+
+                    if rng.random() < 0.1:
+                        spawn_powerup(enemy.rect.center, self.powerup_group, rng, self.balance.powerup_weights)
+
+        # Player bullets vs. boss
+        if self.boss_group:
+            boss_hits = grid.groupcollide(self.player_bullet_group, self.boss_group, True, False, self.collided)
+            for bullet, bosses in boss_hits.items():
+                for boss in bosses:
+                    boss.health -= 1
+                    profiler.count("boss_hits")
+                    self.particles.emit(bullet.rect.center, 5, color=(255, 255, 0),
+                                        radius=(2, 4), lifespan=(10, 20))
+                    if boss.health <= 0:
+                        boss.kill()
+                        self.play_sound("enemy_die")
+                        self.has_boss = False
+                        self.enemy_bullets.clear()
+                        for _ in range(20):
+                            explosion_pos = (
+                                boss.rect.centerx + rng.randint(-50, 50),
+                                boss.rect.centery + rng.randint(-50, 50)
+                            )
+                            explosion_pool.acquire((self.effect_group,), explosion_pos)
+                        boss_score = 200 + (self.level * 50)
+                        self.score += boss_score
+                        self.add_text(f"BOSS DEFEATED! +{boss_score}", 48, YELLOW,
+                                      (WIDTH // 2, HEIGHT // 2), duration=120, speed_y=-0.5)
+                        self.level += 1
+                        self.add_text(f"LEVEL {self.level}!", 48, YELLOW,
+                                      (WIDTH // 2, HEIGHT // 2 + 60), duration=120, speed_y=-0.5)
+                        for _ in range(3):
+                            spawn_pos = (
+                                rng.randint(100, WIDTH - 100),
+                                rng.randint(100, HEIGHT // 2)
+                            )
+                            spawn_powerup(spawn_pos, self.powerup_group, rng, self.balance.powerup_weights)
+                        self.play_sound("explosion")
+
+        player = self.player_group.sprite
+        if not player:
+            return
+
+        # Player vs. enemy collision
+        collided_enemies = grid.spritecollide(player, self.enemy_group, True, self.collided)
+        if collided_enemies:
+            for enemy in collided_enemies:
+                explosion_pool.acquire((self.effect_group,), enemy.rect.center)
+            if player.take_damage():
+                self.particles.emit(player.rect.center, 15, color=(255, 100, 100),
+                                    radius=(3, 6), lifespan=(20, 40))
+                self.play_sound("explosion")
+                if player.lives <= 0:
+                    self.game_over = True
+                    return
+
+        # Player vs. enemy bullets, against a hitbox smaller than the sprite as bullet-hell games do;
+        # a hit clears the screen so one pattern cannot take several lives
+        if self.enemy_bullets.collide_rect(player.rect.inflate(-PLAYER_HITBOX_SHRINK, -PLAYER_HITBOX_SHRINK)):
+            if player.take_damage():
+                self.enemy_bullets.clear()
+                self.particles.emit(player.rect.center, 8, color=(255, 100, 100),
+                                    radius=(2, 5), lifespan=(15, 30))
+                self.play_sound("hit")
+                if player.lives <= 0:
+                    self.game_over = True
+                    return
+
+        # Player vs. powerups
+        powerup_hits = grid.spritecollide(player, self.powerup_group, True)
+        for powerup in powerup_hits:
+            if powerup.type == 'shield':
+                player.shield_active = True
+                player.shield_timer = 0
+                self.add_text("SHIELD ACTIVATED!", 36, YELLOW, (WIDTH // 2, HEIGHT // 3),
+                              duration=60, speed_y=-1)
+            elif powerup.type == 'triple':
+                player.triple_shot = True
+                player.triple_shot_timer = 0
+                self.add_text("TRIPLE SHOT ACTIVATED!", 36, PURPLE, (WIDTH // 2, HEIGHT // 3),
+                              duration=60, speed_y=-1)
+            elif powerup.type == 'bomb':
+                player.bombs += 1
+                self.add_text(f"BOMB ACQUIRED! ({player.bombs})", 36, RED, (WIDTH // 2, HEIGHT // 3),
+                              duration=60, speed_y=-1)
+            self.particles.emit(player.rect.center, 15, color=(255, 255, 0),
+                                radius=(2, 5), lifespan=(20, 40))
+            self.play_sound("powerup")
+
+    def interpolate(self, alpha):
+        """Place moving sprites `alpha` of the way between the last two steps; interpolate(1.0) undoes it."""
+        for group in self.moving_groups:
+            group.sync(alpha)
+
+    def draw(self, surface, alpha=1.0):
+        queue = render_queue
+        background_img = assets.image("background")
         if background_img:
-            darkened = background_img.copy()
-            dark_overlay = pygame.Surface(darkened.get_size(), pygame.SRCALPHA)
-            dark_overlay.fill((0, 0, 0, 150))
-            darkened.blit(dark_overlay, (0, 0))
-            screen.blit(darkened, (0, 0))
+            queue.submit("background", background_img, (0, 0))
         else:
-            screen.fill((10, 10, 40))
-            for star in stars:
-                dimmed_color = tuple(max(0, c-100) for c in star[4][:3])
-                pygame.draw.circle(screen, dimmed_color, (int(star[0]), int(star[1])), star[3])
-                
-        particles.draw(screen)
-        
-        if is_new_high_score:
-            pulse = (pygame.time.get_ticks() % 1000) / 1000
-            scale_factor = 1.0 + 0.1 * math.sin(pulse * 2 * math.pi)
-            scaled_text = pygame.transform.scale(
-                high_score_text, 
-                (int(high_score_text.get_width() * scale_factor), 
-                 int(high_score_text.get_height() * scale_factor))
-            )
-            screen.blit(scaled_text, 
-                      (WIDTH // 2 - scaled_text.get_width() // 2, HEIGHT // 2 + 40))
+            surface.fill((10, 10, 40))
+            queue.extend("background", star_blits(stars, alpha=alpha))
+
+        self.interpolate(alpha)
+        self.submit(queue, alpha)
+        queue.flush(surface)
+        self.interpolate(1.0)
+        profiler.mark("blits")
+
+    def submit(self, queue, alpha=1.0):
+        """Queue the entities, then particles, shield, boss bar and HUD over them.
+
+        Sprite rects are queued, not copied: keep the sprites interpolated
+        until the queue is flushed.
+        """
+        self.entities.submit(queue, alpha)
+        profiler.mark("draw")
+        queue.extend("particles", self.particles.blits(alpha))
+        profiler.mark("particles_draw")
+
+        hud = []
+        player = self.player_group.sprite
+        if player and player.shield_active:
+            hud.append(player.shield_blit(alpha))
+
+        boss = self.boss_group.sprite
+        if boss:
+            hud += bar_blits(WIDTH // 4, 10, WIDTH // 2, 20, boss.health, boss.max_health, RED)
+            boss_text = text_cache.render("BOSS", 30, WHITE)
+            hud.append((boss_text, (WIDTH // 2 - boss_text.get_width() // 2, 35)))
+
+        font_size = 36
+        hud += score_digits.blits("Score: ", self.score, (10, 10))
+        hud.append(text_blit(f"Lives: {player.lives if player else 0}", font_size, WHITE, BLACK, (10, 50)))
+        hud.append(text_blit(f"Level: {self.level}", font_size, WHITE, BLACK, (10, 90)))
+        hud.append(text_blit(f"Bombs: {player.bombs if player else 0}", font_size, WHITE, BLACK, (10, 130)))
+
+        if self.combo_count > 0:
+            combo_color = YELLOW if self.combo_count >= 10 else WHITE
+            hud.append(text_blit(f"Combo: {self.combo_count}x", font_size, combo_color, BLACK, (WIDTH - 200, 10)))
+
+        if player:
+            if player.shield_active:
+                shield_time = int((player.shield_duration - player.shield_timer) / 60)
+                hud.append(text_blit(f"Shield: {shield_time}s", font_size, YELLOW, BLACK, (WIDTH - 200, 50)))
+            if player.triple_shot:
+                triple_time = int((player.triple_shot_duration - player.triple_shot_timer) / 60)
+                hud.append(text_blit(f"Triple Shot: {triple_time}s", font_size, PURPLE, BLACK, (WIDTH - 200, 90)))
+        if profiler.overlay:
+            hud.append(profiler.overlay_blit())
+        queue.extend("hud", hud)
+        profiler.mark("hud")
+
+# ========== DIRTY-RECT RENDERING ==========
+class DirtyRectRenderer:
+    """Opt-in renderer that repaints and pushes only the parts of the screen that changed.
+
+    Each frame the background is restored under last frame's rects, the world's
+    entities and overlay are drawn, and only old + new rects are sent to
+    pygame.display.update(). Without a background image the starfield
+    is frozen into the background. Call invalidate() after anything else has
+    drawn over the screen.
+    """
+    def __init__(self, surface):
+        self.surface = surface
+        self.background = pygame.Surface(surface.get_size()).convert()
+        background_img = assets.image("background")
+        if background_img:
+            self.background.blit(background_img, (0, 0))
         else:
-            screen.blit(high_score_text, 
-                      (WIDTH // 2 - high_score_text.get_width() // 2, HEIGHT // 2 + 40))
-        
-        render_text_with_shadow("GAME OVER", font_large, RED, BLACK, 
-                              (WIDTH // 2 - game_over_text.get_width() // 2, HEIGHT // 3))
-        render_text_with_shadow(f"Final Score: {final_score}", font_medium, WHITE, BLACK, 
-                              (WIDTH // 2 - score_text.get_width() // 2, HEIGHT // 2 - 20))
-        render_text_with_shadow("Press R to Restart", font_small, WHITE, BLACK, 
-                              (WIDTH // 2 - restart_text.get_width() // 2, HEIGHT * 3 // 4))
-        render_text_with_shadow("Press Q to Quit", font_small, WHITE, BLACK, 
-                              (WIDTH // 2 - quit_text.get_width() // 2, HEIGHT * 3 // 4 + 50))
-                              
-        pygame.display.flip()
+            self.background.fill((10, 10, 40))
+            draw_stars(self.background, stars)
+        self._last_rects = []
+        self._full_redraw = True
 
-def create_enemy_wave(enemy_group, all_sprites, count, score):
-    for _ in range(count):
-        enemy = Enemy(score)
-        enemy_group.add(enemy)
-        all_sprites.add(enemy)
+    def invalidate(self):
+        self._full_redraw = True
 
-def main_game(high_score=0):
-    global last_enemy_die_time
-    game_state = MENU
-    score = 0
-    level = 1
-    boss_level_interval = 500
-    next_boss_score = boss_level_interval
-    has_boss = False
-    
-    all_sprites = pygame.sprite.Group()
-    player_group = pygame.sprite.GroupSingle()
-    enemy_group = pygame.sprite.Group()
-    boss_group = pygame.sprite.GroupSingle()
-    player_bullet_group = pygame.sprite.Group()
-    enemy_bullet_group = pygame.sprite.Group()
-    powerup_group = pygame.sprite.Group()
-    text_group = pygame.sprite.Group()
-    
-    spawn_timer = 0
-    spawn_interval = 90  # Slow initial spawn rate
-    combo_count = 0
-    combo_timer = 0
-    
+    def draw(self, world, alpha=1.0):
+        """Draw `world` and return the list of rects to pass to pygame.display.update()."""
+        surface = self.surface
+        queue = render_queue
+        if self._full_redraw:
+            queue.submit("background", self.background, (0, 0))
+        else:
+            queue.extend("background", [(self.background, rect, rect) for rect in self._last_rects])
+
+        world.interpolate(alpha)
+        world.submit(queue, alpha)
+        rects = queue.flush(surface, doreturn=True)[queue.counts.get("background", 0):]
+        world.interpolate(1.0)
+        profiler.mark("blits")
+        if self._full_redraw:
+            self._full_redraw = False
+            dirty = [surface.get_rect()]
+        else:
+            dirty = rects + self._last_rects
+        self._last_rects = rects
+        return dirty
+
+# ========== FRAME PACING ==========
+MAX_STEPS_PER_FRAME = 5  # Beyond this the game slows down rather than spiralling
+
+class FramePacer:
+    """Caps the render rate and measures real frame time for the fixed-step loop.
+
+    clock.tick() sleeps, which is cheap but can wake up late on coarse OS
+    timers. When recent frames keep overshooting their deadline by more than
+    `tolerance_ms`, the pacer switches to clock.tick_busy_loop() (precise but
+    spins a core) and retries sleeping every `probe_frames` frames. Frames
+    whose own work took longer than the budget are counted as missed.
+    """
+    WINDOW = 60
+
+    def __init__(self, fps=60, clock=clock, tolerance_ms=2.0, probe_frames=600):
+        self.clock = clock
+        self.tolerance_ms = tolerance_ms
+        self.probe_frames = probe_frames
+        self.set_fps(fps)
+        self.busy = False
+        self.frames = 0
+        self.missed = 0
+        self.busy_frames = 0
+        self._lateness = deque(maxlen=self.WINDOW)
+        self._last = time.perf_counter()
+
+    def set_fps(self, fps):
+        self.fps = fps
+        self.budget_ms = 1000 / fps
+
+    def reset(self):
+        """Forget the time spent outside the loop (menus, pause, game over)."""
+        self._lateness.clear()
+        self._last = time.perf_counter()
+
+    def wait(self):
+        """Wait until the next frame is due; returns the real ms since the previous call."""
+        work_ms = (time.perf_counter() - self._last) * 1000
+        if self.busy:
+            self.clock.tick_busy_loop(self.fps)
+        else:
+            self.clock.tick(self.fps)
+        now = time.perf_counter()
+        elapsed_ms = (now - self._last) * 1000
+        self._last = now
+        self.frames += 1
+
+        if work_ms > self.budget_ms:
+            self.missed += 1
+            profiler.count("missed_deadlines")
+        elif not self.busy:
+            # Only frames that slept say how precise sleeping is
+            self._lateness.append(elapsed_ms - max(work_ms, self.budget_ms))
+            if len(self._lateness) == self.WINDOW and sorted(self._lateness)[-self.WINDOW // 10] > self.tolerance_ms:
+                self.busy = True
+                self.busy_frames = 0
+        else:
+            self.busy_frames += 1
+            if self.busy_frames >= self.probe_frames:
+                self.busy = False
+                self._lateness.clear()
+        return elapsed_ms
+
+    def summary(self):
+        mode = "busy-wait" if self.busy else "sleep"
+        return f"Frame pacing: {self.missed} of {self.frames} frames missed their {self.budget_ms:.1f} ms deadline ({mode})"
+
+frame_pacer = FramePacer()
+
+AUTOSAVE_STEPS = 300  # steps between autosaves (5 s of play)
+
+def main_game(high_score=0, dirty_rects=False, recorder=None, autosave=None, waves=None, collision="rect",
+              leaderboard=None):
+    """Play until the player returns to the menu; returns the high score.
+
+    The world steps at a fixed 60 FPS while rendering runs at the pacer's rate:
+    real elapsed time fills an accumulator that is drained in FRAME_MS steps,
+    and each render interpolates moving sprites by the leftover fraction.
+
+    With an autosave path the running game is saved there every AUTOSAVE_STEPS
+    steps and resumed from it after a crash; the file is removed once the game
+    ends or the player leaves to the menu.
+
+    Finished games are recorded on the leaderboard, whose best score counts
+    as the high score.
+    """
+    init_display()
+    assets.load_sounds()
+    if leaderboard:
+        leaderboard.start()
+    world = GameWorld(seed=random.randrange(2 ** 32), waves=waves, collision=collision)
+    if recorder:
+        recorder.reset(world.seed)
+    renderer = DirtyRectRenderer(screen) if dirty_rects else None
+    pacer = frame_pacer
     game_state = main_menu()
-    
+    if autosave and not recorder and os.path.exists(autosave):
+        try:
+            with open(autosave, "rb") as f:
+                world.load_state(f.read())
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Ignoring autosave {autosave}: {e}")
+    pacer.reset()
+    accumulator = 0.0
+    bomb = False
+
     running = True
     while running:
         if game_state == PLAYING:
-            if not player_group:
-                all_sprites.empty()
-                player_group.empty()
-                enemy_group.empty()
-                boss_group.empty()
-                player_bullet_group.empty()
-                enemy_bullet_group.empty()
-                powerup_group.empty()
-                text_group.empty()
-                
-                score = 0
-                level = 1
-                next_boss_score = boss_level_interval
-                has_boss = False
-                spawn_timer = 0
-                spawn_interval = 90
-                combo_count = 0
-                combo_timer = 0
-                
-                player = Player()
-                player_group.add(player)
-                all_sprites.add(player)
-                
-                ready_text = TextSprite("Get Ready!", 72, YELLOW, (WIDTH // 2, HEIGHT // 2), duration=120, speed_y=-0.5)
-                text_group.add(ready_text)
-                all_sprites.add(ready_text)
-                
-                create_enemy_wave(enemy_group, all_sprites, 3, score)
-            
+            profiler.begin_frame()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     pygame.quit()
@@ -642,276 +2825,610 @@ def main_game(high_score=0):
                     if event.key == pygame.K_p:
                         game_state = PAUSE
                     elif event.key == pygame.K_b:
-                        player = player_group.sprite
-                        if player and player.use_bomb(enemy_group, boss_group, all_sprites):
-                            bomb_text = TextSprite("BOMB USED!", 48, RED, 
-                                                 (WIDTH // 2, HEIGHT // 2), 
-                                                 duration=60, speed_y=-1)
-                            text_group.add(bomb_text)
-                            all_sprites.add(bomb_text)
-            
+                        bomb = True
+                    elif event.key == pygame.K_F3:
+                        profiler.toggle_overlay()
+            profiler.mark("input")
+
             keys_pressed = pygame.key.get_pressed()
-            player = player_group.sprite
-            if player:
-                if player.update(keys_pressed):
-                    player.shoot(player_bullet_group, all_sprites)
-                    all_sprites.add(player_bullet_group.sprites())
-            
-            spawn_timer += 1
-            if spawn_timer >= spawn_interval:
-                spawn_timer = 0
-                enemy_count = min(1 + level // 2, 5)
-                create_enemy_wave(enemy_group, all_sprites, enemy_count, score)
-                spawn_interval = max(30, 90 - level * 2)
-            
-            if combo_count > 0:
-                combo_timer += 1
-                if combo_timer > 60:
-                    combo_count = 0
-                    combo_timer = 0
-            
-            for sprite in all_sprites:
-                if sprite != player:
-                    sprite.update()
-            
-            boss = boss_group.sprite
-            if boss:
-                result = boss.shoot(enemy_bullet_group)
-                if result == "aim_at_player":
-                    boss.aim_at_player(player_group.sprite, enemy_bullet_group)
-                if result:
-                    all_sprites.add(enemy_bullet_group.sprites())
-            
-            if score >= next_boss_score and not has_boss:
-                boss = Boss(health=100 + level * 20)
-                boss_group.add(boss)
-                all_sprites.add(boss)
-                has_boss = True
-                
-                warning_text = TextSprite("BOSS INCOMING!", 64, RED, 
-                                        (WIDTH // 2, HEIGHT // 2), 
-                                        duration=120, speed_y=0)
-                text_group.add(warning_text)
-                all_sprites.add(warning_text)
-                
-                next_boss_score += boss_level_interval + (level * 100)
-            
-            # Collision detection: Player bullets vs. enemies
-            hits = pygame.sprite.groupcollide(player_bullet_group, enemy_group, True, False)
-            if hits:
-                current_time = pygame.time.get_ticks()
-                play_sound = (current_time - last_enemy_die_time >= SOUND_COOLDOWN)
-                for bullet, enemies in hits.items():
-                    for enemy in enemies:
-                        if enemy.take_damage():
-                            enemy.kill()
-                            if enemy_die_sound and play_sound:
-                                if DEBUG:
-                                    print("Playing enemy_die.wav for bullet-killed enemy")
-                                enemy_die_sound.play()
-                                last_enemy_die_time = current_time
-                                play_sound = False
-                            for _ in range(10):
-                                particle = Particle(enemy.rect.center, PINK, 
-                                                  radius=random.randint(2, 5), 
-                                                  lifespan=random.randint(20, 40))
-                                all_sprites.add(particle)
-                            
-                            combo_count += 1
-                            combo_timer = 0
-                            score_add = 10 * (1 + min(combo_count // 5, 4))
-                            score += score_add
-                            
-                            score_text = TextSprite(f"+{score_add}", 24, WHITE, 
-                                                  enemy.rect.center, 
-                                                  duration=30, speed_y=-1)
-                            text_group.add(score_text)
-                            all_sprites.add(score_text)
-                            
-                            if combo_count % 5 == 0 and combo_count > 0:
-                                combo_text = TextSprite(f"{combo_count} COMBO!", 36, YELLOW, 
-                                                      (WIDTH // 2, HEIGHT // 3), 
-                                                      duration=60, speed_y=-1)
-                                text_group.add(combo_text)
-                                all_sprites.add(combo_text)
-                            
-                            if random.random() < 0.1:
-                                spawn_powerup(enemy.rect.center, powerup_group, all_sprites)
-            
-            # Player bullets vs. boss
-            if boss_group:
-                boss_hits = pygame.sprite.groupcollide(player_bullet_group, boss_group, True, False)
-                if boss_hits:
-                    current_time = pygame.time.get_ticks()
-                    play_sound = (current_time - last_enemy_die_time >= SOUND_COOLDOWN)
-                    for bullet, bosses in boss_hits.items():
-                        for boss in bosses:
-                            boss.health -= 1
-                            hit_x = bullet.rect.centerx
-                            hit_y = bullet.rect.centery
-                            for _ in range(5):
-                                particle = Particle((hit_x, hit_y), 
-                                                  color=(255, 255, 0), 
-                                                  radius=random.randint(2, 4), 
-                                                  lifespan=random.randint(10, 20))
-                                all_sprites.add(particle)
-                            if boss.health <= 0:
-                                boss.kill()
-                                if enemy_die_sound and play_sound:
-                                    if DEBUG:
-                                        print("Playing enemy_die.wav for bullet-killed boss")
-                                    enemy_die_sound.play()
-                                    last_enemy_die_time = current_time
-                                has_boss = False
-                                for _ in range(20):
-                                    explosion_pos = (
-                                        boss.rect.centerx + random.randint(-50, 50),
-                                        boss.rect.centery + random.randint(-50, 50)
-                                    )
-                                    explosion = Explosion(explosion_pos)
-                                    all_sprites.add(explosion)
-                                boss_score = 200 + (level * 50)
-                                score += boss_score
-                                victory_text = TextSprite(f"BOSS DEFEATED! +{boss_score}", 48, YELLOW, 
-                                                        (WIDTH // 2, HEIGHT // 2), 
-                                                        duration=120, speed_y=-0.5)
-                                text_group.add(victory_text)
-                                all_sprites.add(victory_text)
-                                level += 1
-                                level_text = TextSprite(f"LEVEL {level}!", 48, YELLOW, 
-                                                      (WIDTH // 2, HEIGHT // 2 + 60), 
-                                                      duration=120, speed_y=-0.5)
-                                text_group.add(level_text)
-                                all_sprites.add(level_text)
-                                for _ in range(3):
-                                    spawn_pos = (
-                                        random.randint(100, WIDTH - 100),
-                                        random.randint(100, HEIGHT // 2)
-                                    )
-                                    spawn_powerup(spawn_pos, powerup_group, all_sprites)
-                                if explosion_sound:
-                                    explosion_sound.play()
-            
-            # Player vs. enemy collision
-            player = player_group.sprite
-            if player:
-                collided_enemies = pygame.sprite.spritecollide(player, enemy_group, True)
-                if collided_enemies:
-                    for enemy in collided_enemies:
-                        explosion = Explosion(enemy.rect.center)
-                        all_sprites.add(explosion)
-                    if player.take_damage():
-                        for _ in range(15):
-                            particle = Particle(player.rect.center, 
-                                              color=(255, 100, 100), 
-                                              radius=random.randint(3, 6), 
-                                              lifespan=random.randint(20, 40))
-                            all_sprites.add(particle)
-                        if explosion_sound:
-                            explosion_sound.play()
-                        if player.lives <= 0:
-                            game_state, high_score = game_over_screen(score, high_score)
-                            continue
-            
-            # Player vs. enemy bullets
-            if player:
-                bullet_hits = pygame.sprite.spritecollide(player, enemy_bullet_group, True)
-                if bullet_hits:
-                    if player.take_damage():
-                        for _ in range(8):
-                            particle = Particle(player.rect.center, 
-                                              color=(255, 100, 100), 
-                                              radius=random.randint(2, 5), 
-                                              lifespan=random.randint(15, 30))
-                            all_sprites.add(particle)
-                        if hit_sound:
-                            hit_sound.play()
-                        if player.lives <= 0:
-                            game_state, high_score = game_over_screen(score, high_score)
-                            continue
-            
-            # Player vs. powerups
-            if player:
-                powerup_hits = pygame.sprite.spritecollide(player, powerup_group, True)
-                for powerup in powerup_hits:
-                    if powerup.type == 'shield':
-                        player.shield_active = True
-                        player.shield_timer = 0
-                        powerup_text = TextSprite("SHIELD ACTIVATED!", 36, YELLOW, 
-                                                (WIDTH // 2, HEIGHT // 3), 
-                                                duration=60, speed_y=-1)
-                    elif powerup.type == 'triple':
-                        player.triple_shot = True
-                        player.triple_shot_timer = 0
-                        powerup_text = TextSprite("TRIPLE SHOT ACTIVATED!", 36, PURPLE, 
-                                                (WIDTH // 2, HEIGHT // 3), 
-                                                duration=60, speed_y=-1)
-                    elif powerup.type == 'bomb':
-                        player.bombs += 1
-                        powerup_text = TextSprite(f"BOMB ACQUIRED! ({player.bombs})", 36, RED, 
-                                                (WIDTH // 2, HEIGHT // 3), 
-                                                duration=60, speed_y=-1)
-                    text_group.add(powerup_text)
-                    all_sprites.add(powerup_text)
-                    for _ in range(15):
-                        particle = Particle(player.rect.center, 
-                                          color=(255, 255, 0), 
-                                          radius=random.randint(2, 5), 
-                                          lifespan=random.randint(20, 40))
-                        all_sprites.add(particle)
-                    if powerup_sound:
-                        powerup_sound.play()
-            
-            if background_img:
-                screen.blit(background_img, (0, 0))
-            else:
-                screen.fill((10, 10, 40))
+            steps = 0
+            while accumulator >= FRAME_MS and steps < MAX_STEPS_PER_FRAME:
+                # A bomb press is used by the first step that sees it
+                inputs = read_input(keys_pressed, bomb)
+                bomb = False
+                if recorder:
+                    recorder.write(inputs)
+                world.step(inputs)
+                # The starfield behind the world scrolls with the simulation, not the render rate
                 update_stars(stars)
-                draw_stars(screen, stars)
-            
-            all_sprites.draw(screen)
-            
-            if player and player.shield_active:
-                player.draw_shield(screen)
-            
-            boss = boss_group.sprite
-            if boss:
-                draw_bar(screen, WIDTH // 4, 10, WIDTH // 2, 20, 
-                        boss.health, boss.max_health, RED)
-                boss_text = pygame.font.Font(None, 30).render("BOSS", True, WHITE)
-                screen.blit(boss_text, (WIDTH // 2 - boss_text.get_width() // 2, 35))
-            
-            font = pygame.font.Font(None, 36)
-            render_text_with_shadow(f"Score: {score}", font, WHITE, BLACK, (10, 10))
-            render_text_with_shadow(f"Lives: {player.lives if player else 0}", font, WHITE, BLACK, (10, 50))
-            render_text_with_shadow(f"Level: {level}", font, WHITE, BLACK, (10, 90))
-            render_text_with_shadow(f"Bombs: {player.bombs if player else 0}", font, WHITE, BLACK, (10, 130))
-            
-            if combo_count > 0:
-                combo_color = YELLOW if combo_count >= 10 else WHITE
-                render_text_with_shadow(f"Combo: {combo_count}x", font, combo_color, BLACK, 
-                                      (WIDTH - 200, 10))
-            
-            if player:
-                if player.shield_active:
-                    shield_time = int((player.shield_duration - player.shield_timer) / 60)
-                    render_text_with_shadow(f"Shield: {shield_time}s", font, YELLOW, BLACK, 
-                                          (WIDTH - 200, 50))
-                if player.triple_shot:
-                    triple_time = int((player.triple_shot_duration - player.triple_shot_timer) / 60)
-                    render_text_with_shadow(f"Triple Shot: {triple_time}s", font, PURPLE, BLACK, 
-                                          (WIDTH - 200, 90))
-        
+                accumulator -= FRAME_MS
+                steps += 1
+                if world.game_over:
+                    break
+                if autosave and world.frame % AUTOSAVE_STEPS == 0:
+                    save_snapshot(world, autosave)
+            profiler.count("steps", steps)
+            audio_manager.flush()
+            profiler.mark("audio")
+            if steps == MAX_STEPS_PER_FRAME:
+                accumulator = min(accumulator, FRAME_MS)
+            if world.game_over:
+                if autosave and os.path.exists(autosave):
+                    os.remove(autosave)
+                if leaderboard:
+                    high_score = max(high_score, leaderboard.best())
+                    leaderboard.record(world.run_stats())
+                game_state, high_score = game_over_screen(world.score, high_score)
+                if game_state == PLAYING:
+                    world.reset(random.randrange(2 ** 32))
+                    if recorder:
+                        recorder.reset(world.seed)
+                if renderer:
+                    renderer.invalidate()
+                pacer.reset()
+                accumulator = 0.0
+                continue
+
+            alpha = accumulator / FRAME_MS
+            if renderer:
+                pygame.display.update(renderer.draw(world, alpha))
+            else:
+                world.draw(screen, alpha)
+                pygame.display.flip()
+            profiler.mark("flip")
+            profiler.end_frame(world.sprite_counts)
+
         elif game_state == PAUSE:
             game_state = pause_game()
-        
+            if renderer:
+                renderer.invalidate()
+            pacer.reset()
+            accumulator = 0.0
+            continue
+
         elif game_state == MENU:
-            return
-        
-        pygame.display.flip()
-        clock.tick(60)
+            if autosave and os.path.exists(autosave):
+                os.remove(autosave)
+            return high_score
+
+        accumulator += pacer.wait()
+
+# ========== STATE SNAPSHOTS ==========
+# Binary form of GameWorld.snapshot(), little endian:
+#   header      magic, version
+#   core        seed, clock, counters and flags (SNAPSHOT_CORE)
+#   rng         Mersenne Twister state as 625 u32, then gauss_next
+#   player      present flag, then SNAPSHOT_PLAYER
+#   boss        present flag, then SNAPSHOT_BOSS
+#   entities    enemy, bullet, power-up and enemy bullet counts, then per-kind arrays of f64 positions
+#               and speeds, i32 bullet animation (frame index, timer) and enemy bullet lifespans, and u8
+#               power-up type ids and enemy bullet styles
+# Surfaces are never stored: sprites are rebuilt from the asset manager on restore, bullet images
+# by animation frame index and power-ups by their index in POWERUP_TYPES. Like the Balance, the wave
+# schedule is configuration: only the position in it is saved, so load into a world built with the same one.
+SNAPSHOT_MAGIC = b"SSSN"
+SNAPSHOT_VERSION = 4
+SNAPSHOT_HEADER = struct.Struct("<4sB")
+SNAPSHOT_CORE = struct.Struct("<?QqIIHI?HdIII?")
+SNAPSHOT_RNG = struct.Struct("<B?d")
+SNAPSHOT_PLAYER = struct.Struct("<iihh?II?IIq")
+SNAPSHOT_BOSS = struct.Struct("<iiiiIb")
+SNAPSHOT_COUNTS = struct.Struct("<IIII")
+
+def pack_snapshot(state):
+    """Pack a GameWorld.snapshot() dict into bytes."""
+    rng_version, mt_state, gauss_next = state["rng"]
+    clock_frame = state["clock"]
+    parts = [
+        SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION),
+        SNAPSHOT_CORE.pack(state["seed"] is not None, state["seed"] or 0,
+                           -1 if clock_frame is None else clock_frame, state["frame"], state["score"],
+                           state["level"], state["next_boss_score"], state["has_boss"], state["wave"],
+                           state["wave_start"], state["combo_count"], state["combo_timer"],
+                           state["peak_combo"], state["game_over"]),
+        SNAPSHOT_RNG.pack(rng_version, gauss_next is not None, gauss_next or 0.0),
+        array("I", mt_state).tobytes(),
+    ]
+    for key, layout in (("player", SNAPSHOT_PLAYER), ("boss", SNAPSHOT_BOSS)):
+        parts.append(b"\x01" + layout.pack(*state[key]) if state[key] else b"\x00")
+    enemies, bullets, powerups = state["enemies"], state["bullets"], state["powerups"]
+    enemy_bullet_motion, enemy_bullet_lifespans, enemy_bullet_styles = state["enemy_bullets"]
+    parts.append(SNAPSHOT_COUNTS.pack(len(enemies), len(bullets), len(powerups), len(enemy_bullet_lifespans)))
+    parts.append(array("d", [value for enemy in enemies for value in enemy]).tobytes())
+    parts.append(array("d", [value for bullet in bullets for value in bullet[:4]]).tobytes())
+    parts.append(array("i", [value for bullet in bullets for value in bullet[4:]]).tobytes())
+    parts.append(array("B", [POWERUP_TYPES.index(powerup[0]) for powerup in powerups]).tobytes())
+    parts.append(array("d", [value for powerup in powerups for value in powerup[1:]]).tobytes())
+    parts.append(np.ascontiguousarray(enemy_bullet_motion, dtype="<f8").tobytes())
+    parts.append(np.ascontiguousarray(enemy_bullet_lifespans, dtype="<i4").tobytes())
+    parts.append(np.ascontiguousarray(enemy_bullet_styles, dtype=np.uint8).tobytes())
+    return b"".join(parts)
+
+def unpack_snapshot(data):
+    """Inverse of pack_snapshot(): bytes back to a GameWorld.snapshot() dict."""
+    magic, version = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("not a Strawberry Shooter snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version {version}")
+    pos = SNAPSHOT_HEADER.size
+
+    def take(layout):
+        nonlocal pos
+        values = layout.unpack_from(data, pos)
+        pos += layout.size
+        return values
+
+    def take_array(typecode, count):
+        nonlocal pos
+        values = array(typecode)
+        values.frombytes(data[pos:pos + count * values.itemsize])
+        pos += count * values.itemsize
+        return values.tolist()
+
+    def take_column(dtype, count):
+        nonlocal pos
+        values = np.frombuffer(data, dtype, count, pos)
+        pos += values.nbytes
+        return values
+
+    def grouped(values, n):
+        return [tuple(values[i:i + n]) for i in range(0, len(values), n)]
+
+    (has_seed, seed, clock_frame, frame, score, level, next_boss_score, has_boss, wave,
+     wave_start, combo_count, combo_timer, peak_combo, game_over) = take(SNAPSHOT_CORE)
+    rng_version, has_gauss, gauss_next = take(SNAPSHOT_RNG)
+    mt_state = tuple(take_array("I", 625))
+    optional = {}
+    for key, layout in (("player", SNAPSHOT_PLAYER), ("boss", SNAPSHOT_BOSS)):
+        pos += 1
+        optional[key] = take(layout) if data[pos - 1] else None
+    n_enemies, n_bullets, n_powerups, n_enemy_bullets = take(SNAPSHOT_COUNTS)
+    enemies = grouped(take_array("d", n_enemies * 3), 3)
+    bullet_motion = grouped(take_array("d", n_bullets * 4), 4)
+    bullet_anim = grouped(take_array("i", n_bullets * 2), 2)
+    powerup_types = take_array("B", n_powerups)
+    powerup_pos = grouped(take_array("d", n_powerups * 2), 2)
+    enemy_bullet_motion = take_column("<f8", n_enemy_bullets * 4).reshape(n_enemy_bullets, 4)
+    enemy_bullet_lifespans = take_column("<i4", n_enemy_bullets)
+    enemy_bullet_styles = take_column(np.uint8, n_enemy_bullets)
+    return {
+        "seed": seed if has_seed else None,
+        "rng": (rng_version, mt_state, gauss_next if has_gauss else None),
+        "clock": None if clock_frame < 0 else clock_frame,
+        "frame": frame,
+        "score": score,
+        "level": level,
+        "next_boss_score": next_boss_score,
+        "has_boss": has_boss,
+        "wave": wave,
+        "wave_start": wave_start,
+        "combo_count": combo_count,
+        "combo_timer": combo_timer,
+        "peak_combo": peak_combo,
+        "game_over": game_over,
+        "player": optional["player"],
+        "enemies": enemies,
+        "bullets": [motion + anim for motion, anim in zip(bullet_motion, bullet_anim)],
+        "powerups": [(POWERUP_TYPES[kind],) + xy for kind, xy in zip(powerup_types, powerup_pos)],
+        "boss": optional["boss"],
+        "enemy_bullets": (enemy_bullet_motion, enemy_bullet_lifespans, enemy_bullet_styles),
+    }
+
+def save_snapshot(world, path):
+    """Write world.save_state() to `path` atomically, so a crash mid-write keeps the previous save."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(world.save_state())
+    os.replace(tmp_path, path)
+
+# ========== LEADERBOARD ==========
+LEADERBOARD_PATH = os.path.join(BASE_DIR, "leaderboard.db")
+LEADERBOARD_SCHEMA = 1  # stored in PRAGMA user_version
+
+# One finished game; duration is game time in seconds
+RunStats = namedtuple("RunStats", ["score", "level", "duration", "peak_combo", "seed"])
+
+class Leaderboard:
+    """Every finished run's stats in a SQLite database, written behind the game.
+
+    record() only puts the run on a bounded queue: a daemon writer thread owns
+    the write connection and commits whatever is queued in one transaction,
+    so the game-over screen never waits on the disk. When the queue is full
+    the run is dropped and counted. The database (WAL mode, so reads never
+    wait on the writer) is opened by the writer when start() is first called,
+    which also loads the best score; queries open their own connection on
+    first use. Scores are indexed for top().
+    """
+    QUEUE_SIZE = 64
+
+    def __init__(self, path=LEADERBOARD_PATH):
+        self.path = path
+        self.dropped = 0
+        self._queue = Queue(self.QUEUE_SIZE)
+        self._writer = None
+        self._reader = None
+        self._loaded = threading.Event()
+        self._best = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL commits stay atomic, fsync only at checkpoints
+        return conn
+
+    def start(self):
+        """Open the database and load the best score on the writer thread (once)."""
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_behind, name="leaderboard-writer", daemon=True)
+            self._writer.start()
+
+    def _write_behind(self):
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute("""CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY,
+                    played_at REAL NOT NULL,
+                    score INTEGER NOT NULL,
+                    level INTEGER NOT NULL,
+                    duration REAL NOT NULL,
+                    peak_combo INTEGER NOT NULL,
+                    seed INTEGER)""")
+                conn.execute("CREATE INDEX IF NOT EXISTS runs_by_score ON runs (score DESC, played_at)")
+                conn.execute(f"PRAGMA user_version = {LEADERBOARD_SCHEMA}")
+            best = conn.execute("SELECT MAX(score) FROM runs").fetchone()[0]
+            self._best = max(self._best, best or 0)
+        except sqlite3.Error as e:
+            print(f"Leaderboard unavailable ({self.path}): {e}. Scores will not be saved.")
+            conn = None
+        self._loaded.set()
+
+        while True:
+            runs = [self._queue.get()]
+            while not self._queue.empty():
+                runs.append(self._queue.get())
+            stop = None in runs
+            runs = [run for run in runs if run is not None]
+            if conn is not None and runs:
+                try:
+                    with conn:
+                        conn.executemany("INSERT INTO runs (played_at, score, level, duration, peak_combo, seed) "
+                                         "VALUES (?, ?, ?, ?, ?, ?)", runs)
+                except sqlite3.Error as e:
+                    print(f"Could not save {len(runs)} runs to {self.path}: {e}")
+            for _ in range(len(runs) + stop):
+                self._queue.task_done()
+            if stop:
+                break
+        if conn is not None:
+            conn.close()
+
+    def record(self, stats):
+        """Queue a finished run for writing; never blocks."""
+        self.start()
+        self._best = max(self._best, stats.score)
+        try:
+            self._queue.put_nowait((time.time(),) + tuple(stats))
+        except Full:
+            self.dropped += 1
+            if DEBUG:
+                print(f"Leaderboard queue full, run dropped ({self.dropped} so far)")
+
+    def best(self):
+        """The best score recorded so far, without blocking: until the writer has loaded
+        the database this only counts runs recorded since then."""
+        return self._best
+
+    def top(self, n=10):
+        """The `n` best runs as (played_at, score, level, duration, peak_combo, seed) rows, queued ones included."""
+        self.start()
+        self._loaded.wait()  # the writer creates the table
+        self.flush()
+        if self._reader is None:
+            self._reader = self._connect()
+        return self._reader.execute("SELECT played_at, score, level, duration, peak_combo, seed FROM runs "
+                                    "ORDER BY score DESC, played_at LIMIT ?", (n,)).fetchall()
+
+    def flush(self):
+        """Wait until every queued run is committed."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        """Commit the queued runs and stop the writer."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+# ========== INPUT RECORDING & REPLAY ==========
+# Recording file: REPLAY_MAGIC + version byte, then a stream of records:
+#   REPLAY_RESET, u64 seed      -> (re)start the world with this seed
+#   mask, LEB128 run length     -> `run length` frames with this input bitmask
+# The version is bumped whenever the simulation changes, as old inputs no longer replay the same game.
+REPLAY_MAGIC = b"SSRP"
+REPLAY_VERSION = 6
+REPLAY_RESET = 0xFF
+INPUT_BITS = ("left", "right", "fire", "bomb")
+INPUT_BY_MASK = [FrameInput(*(bool(mask & (1 << bit)) for bit in range(len(INPUT_BITS))))
+                 for mask in range(1 << len(INPUT_BITS))]
+
+def input_mask(inputs):
+    mask = 0
+    for bit, pressed in enumerate(inputs):
+        if pressed:
+            mask |= 1 << bit
+    return mask
+
+def encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+class InputRecorder:
+    """Streams per-frame inputs to disk as run-length encoded bitmasks."""
+    FLUSH_EVERY = 64  # runs
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(REPLAY_MAGIC + bytes([REPLAY_VERSION]))
+        self._mask = None
+        self._run = 0
+        self._runs_written = 0
+
+    def reset(self, seed):
+        """Mark a new game started with `seed`."""
+        self._flush_run()
+        self.file.write(bytes([REPLAY_RESET]) + struct.pack("<Q", seed))
+        self.file.flush()
+
+    def write(self, inputs):
+        mask = input_mask(inputs)
+        if mask != self._mask:
+            self._flush_run()
+            self._mask = mask
+        self._run += 1
+
+    def _flush_run(self):
+        if self._run:
+            self.file.write(bytes([self._mask]) + encode_varint(self._run))
+            self._runs_written += 1
+            if self._runs_written % self.FLUSH_EVERY == 0:
+                self.file.flush()
+        self._mask = None
+        self._run = 0
+
+    def close(self):
+        if not self.file.closed:
+            self._flush_run()
+            self.file.close()
+
+def read_recording(path):
+    """Decode a recording into (per-frame masks with REPLAY_RESET entries, seeds in order)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != REPLAY_MAGIC or len(data) < 5:
+        raise ValueError(f"{path} is not a Strawberry Shooter recording")
+    if data[4] != REPLAY_VERSION:
+        raise ValueError(f"{path} has unsupported recording version {data[4]}")
+    stream = bytearray()
+    seeds = []
+    pos = 5
+    while pos < len(data):
+        mask = data[pos]
+        pos += 1
+        if mask == REPLAY_RESET:
+            seeds.append(struct.unpack_from("<Q", data, pos)[0])
+            stream.append(REPLAY_RESET)
+            pos += 8
+            continue
+        run = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            run |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        stream.extend(bytes([mask]) * run)
+    return stream, seeds
+
+class Replay:
+    """Plays a recording back through a GameWorld, unthrottled and without a display.
+
+    The position counts stream entries (frames plus reset markers). A binary
+    world snapshot (save_state()) is kept every snapshot_interval entries, so
+    seek() only has to re-simulate from the nearest earlier snapshot. Games
+    recorded with a wave file or mask collisions need the same `waves` and
+    `collision` passed in.
+    """
+    def __init__(self, path, snapshot_interval=600, waves=None, collision="rect"):
+        self.stream, self.seeds = read_recording(path)
+        self.waves = waves
+        self.collision = collision
+        if not self.stream or self.stream[0] != REPLAY_RESET:
+            raise ValueError(f"{path} does not start with a game seed")
+        self.snapshot_interval = snapshot_interval
+        self.world = None
+        self.position = 0
+        self.games = 0
+        self.scores = []
+        self.snapshots = {}
+
+    def __len__(self):
+        return len(self.stream)
+
+    def step(self):
+        """Apply the next stream entry; returns False at the end of the recording."""
+        if self.position >= len(self.stream):
+            return False
+        mask = self.stream[self.position]
+        if mask == REPLAY_RESET:
+            if self.world is not None:
+                self.scores.append(self.world.score)
+            seed = self.seeds[self.games]
+            if self.world is None:
+                self.world = GameWorld(seed=seed, waves=self.waves, collision=self.collision)
+            else:
+                self.world.reset(seed)
+            self.games += 1
+        else:
+            self.world.step(INPUT_BY_MASK[mask])
+        self.position += 1
+        if self.position % self.snapshot_interval == 0 and self.position not in self.snapshots:
+            self.snapshots[self.position] = (self.world.save_state(), self.games, list(self.scores))
+        return True
+
+    def run(self):
+        while self.step():
+            pass
+        return self.scores + [self.world.score]
+
+    def seek(self, position):
+        """Move to `position`, restoring the nearest snapshot at or before it."""
+        position = min(position, len(self.stream))
+        best = max((p for p in self.snapshots if p <= position), default=None)
+        if best is not None and (position < self.position or best > self.position):
+            state, self.games, scores = self.snapshots[best]
+            self.scores = list(scores)
+            self.world.load_state(state)
+            self.position = best
+        elif position < self.position:
+            self.world = None
+            self.position = self.games = 0
+            self.scores = []
+        while self.position < position and self.step():
+            pass
+
+# ========== HEADLESS SIMULATION ==========
+def random_bot_input(rng):
+    move = rng.random()
+    return FrameInput(left=move < 0.3, right=0.3 <= move < 0.6, fire=True, bomb=rng.random() < 0.002)
+
+def run_headless(frames, seed=0, waves=None, collision="rect"):
+    """Run the simulation unthrottled without drawing, restarting after each game over."""
+    world = GameWorld(seed=seed, waves=waves, collision=collision)
+    policy_rng = random.Random(seed)
+    scores = []
+    start = time.perf_counter()
+    for _ in range(frames):
+        profiler.begin_frame()
+        world.step(random_bot_input(policy_rng))
+        audio_manager.flush()
+        profiler.end_frame(world.sprite_counts)
+        if world.game_over:
+            scores.append(world.score)
+            world.reset(seed + len(scores))
+    elapsed = time.perf_counter() - start
+    print(f"{frames} frames in {elapsed:.2f}s ({frames / elapsed:.0f} frames/s)")
+    print(f"Games finished: {len(scores)}, scores: {scores}, current score: {world.score}")
+    for pool in (bullet_pool, enemy_pool, explosion_pool, text_pool):
+        print("Pool {class}: high water {high_water}, created {created}, reused {reused}, dropped {dropped}".format(**pool.stats()))
+    for name, counts in audio_manager.stats().items():
+        print("Sound {}: played {played}, dropped {dropped}, coalesced {coalesced}".format(name, **counts))
+    if profiler.enabled:
+        for phase, (p50, p95, p99) in profiler.summary()["phases_ms"].items():
+            print(f"{phase:>12}: p50 {p50:.3f} ms, p95 {p95:.3f} ms, p99 {p99:.3f} ms")
+        print(f"Counters: {dict(profiler.counters)}")
+    return scores
+
+def run_replay(path, waves=None, collision="rect"):
+    """Replay a recording as fast as possible and report each game's score."""
+    replay = Replay(path, waves=waves, collision=collision)
+    start = time.perf_counter()
+    while True:
+        profiler.begin_frame()
+        if not replay.step():
+            break
+        profiler.end_frame(replay.world.sprite_counts)
+    elapsed = time.perf_counter() - start
+    scores = replay.scores + [replay.world.score]
+    print(f"Replayed {len(replay)} frames in {elapsed:.2f}s ({len(replay) / elapsed:.0f} frames/s)")
+    print(f"Games: {replay.games}, scores: {scores}")
+    if profiler.enabled:
+        for phase, (p50, p95, p99) in profiler.summary()["phases_ms"].items():
+            print(f"{phase:>12}: p50 {p50:.3f} ms, p95 {p95:.3f} ms, p99 {p99:.3f} ms")
+    return scores
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Strawberry Shooter - Birthday Edition")
+    parser.add_argument("--headless", action="store_true", help="run the simulation without a display")
+    parser.add_argument("--frames", type=int, default=10000, help="frames to simulate in headless mode")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed for headless mode")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="redraw only the changed parts of the screen (for fill-rate bound machines)")
+    parser.add_argument("--profile", action="store_true",
+                        help="collect frame timings (shows the F3 overlay; headless prints a summary)")
+    parser.add_argument("--record", metavar="PATH", help="record this session's inputs for replay")
+    parser.add_argument("--replay", metavar="PATH", help="replay a recording headless and report the outcome")
+    parser.add_argument("--trace", metavar="PATH", help="write a per-frame profile trace (.csv or .json) on exit")
+    parser.add_argument("--fps", type=int, default=60,
+                        help="render frame rate cap; the game logic always runs at 60 steps/s")
+    parser.add_argument("--waves", metavar="PATH", help="enemy wave file (.json or .toml) instead of the endless default")
+    parser.add_argument("--collision", choices=COLLISION_MODES, default="rect",
+                        help="hit test sprites by rect, or by pixel masks after a rect prefilter")
+    parser.add_argument("--build-atlas", action="store_true",
+                        help="pack the sprite atlas and its index into the asset cache, then exit")
+    parser.add_argument("--autosave", metavar="PATH",
+                        help="save the running game to PATH periodically and resume from it after a crash")
+    parser.add_argument("--scores", metavar="PATH", default=LEADERBOARD_PATH,
+                        help="leaderboard database finished games are recorded in")
+    parser.add_argument("--top", type=int, metavar="N", help="print the N best runs on the leaderboard, then exit")
+    args = parser.parse_args()
+    frame_pacer.set_fps(args.fps)
+    waves = None
+    if args.waves:
+        try:
+            waves = load_waves(args.waves)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    if args.profile:
+        profiler.enable()
+        if not args.headless:
+            profiler.toggle_overlay()
+            atexit.register(lambda: print(frame_pacer.summary()))
+    if args.trace:
+        profiler.start_trace()
+        atexit.register(profiler.dump, args.trace)
+    if args.build_atlas:
+        atlas.load(rebuild=True)
+        print(f"Packed {len(atlas.areas)} images into a {atlas.sheet.get_width()}x{atlas.sheet.get_height()} "
+              f"atlas in {atlas.cache_dir}")
+        sys.exit()
+    if args.replay:
+        run_replay(args.replay, waves, args.collision)
+        sys.exit()
+    if args.headless:
+        run_headless(args.frames, args.seed, waves, args.collision)
+        sys.exit()
+
+    leaderboard = Leaderboard(args.scores)
+    atexit.register(leaderboard.close)
+    if args.top:
+        try:
+            runs = leaderboard.top(args.top)
+        except sqlite3.Error as e:
+            parser.error(f"cannot read {args.scores}: {e}")
+        for rank, (played_at, score, level, duration, peak_combo, seed) in enumerate(runs, 1):
+            print(f"{rank:3}. {score:7}  level {level:3}  {duration:7.1f}s  combo {peak_combo:4}  "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(played_at))}  seed {seed}")
+        sys.exit()
+
+    recorder = None
+    if args.record:
+        recorder = InputRecorder(args.record)
+        atexit.register(recorder.close)
     high_score = 0
     while True:
-        main_game(high_score)
\ No newline at end of file
+        high_score = main_game(high_score, dirty_rects=args.dirty_rects, recorder=recorder,
+                               autosave=args.autosave, waves=waves, collision=args.collision,
+                               leaderboard=leaderboard)
@@ -0,0 +1,212 @@
+"""Batch balance sweeps for Strawberry Shooter.
+
+Runs many headless games across a process pool, one per (parameter set, seed),
+and streams per-run metrics to a columnar JSON Lines file: every line is a
+batch of runs stored as {"column": [values, ...]}. Parameters are the fields of
+shooter_game.Balance.
+
+    python simulate.py --param spawn_interval=60,90,120 --param enemy_speed_max=1.0,1.5 \\
+        --seeds 0:200 --policy sweeper --output sweep.jsonl
+
+At the end a summary per parameter set is printed, flagging the sets whose peak
+sprite count or mean frame cost exceed --budget-sprites / --budget-ms.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import functools
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+
+import shooter_game as game
+
+game.DEBUG = False
+
+# ========== BOT POLICIES ==========
+def random_policy(world, rng):
+    return game.random_bot_input(rng)
+
+def idle_policy(world, rng):
+    return game.FrameInput(fire=True)
+
+def sweeper_policy(world, rng):
+    """Chase the lowest enemy, fire constantly and bomb when the screen fills up."""
+    player = world.player
+    enemies = world.enemy_group.sprites()
+    if not player or not enemies:
+        return game.FrameInput(fire=True)
+    target = max(enemies, key=lambda enemy: enemy.rect.bottom)
+    dx = target.rect.centerx - player.rect.centerx
+    return game.FrameInput(left=dx < -5, right=dx > 5, fire=True, bomb=len(enemies) > 15)
+
+POLICIES = {
+    "random": random_policy,
+    "idle": idle_policy,
+    "sweeper": sweeper_policy,
+}
+
+# ========== RUNS ==========
+@functools.lru_cache(maxsize=None)
+def load_waves(path):
+    return path and game.load_waves(path)
+
+def run_game(params, seed, policy, max_frames, waves=None):
+    """Play one game to game over (or max_frames) and return its metrics.
+
+    `waves` is a wave file path; without one the Balance-driven default schedule is used.
+    """
+    world = game.GameWorld(seed=seed, balance=game.Balance(**params), waves=load_waves(waves))
+    policy_fn = POLICIES[policy]
+    policy_rng = random.Random(seed)
+    peak_sprites = peak_enemies = peak_bullets = peak_particles = 0
+    step_ns = 0
+    perf_counter_ns = time.perf_counter_ns
+    while not world.game_over and world.frame < max_frames:
+        inputs = policy_fn(world, policy_rng)
+        start = perf_counter_ns()
+        world.step(inputs)
+        step_ns += perf_counter_ns() - start
+        peak_sprites = max(peak_sprites, len(world.entities))
+        peak_enemies = max(peak_enemies, len(world.enemy_group))
+        peak_bullets = max(peak_bullets, len(world.player_bullet_group) + len(world.enemy_bullets))
+        peak_particles = max(peak_particles, len(world.particles))
+    return {
+        **params,
+        "seed": seed,
+        "policy": policy,
+        "score": world.score,
+        "level": world.level,
+        "frames": world.frame,
+        "game_over": world.game_over,
+        "peak_sprites": peak_sprites,
+        "peak_enemies": peak_enemies,
+        "peak_bullets": peak_bullets,
+        "peak_particles": peak_particles,
+        "mean_step_ms": step_ns / max(world.frame, 1) / 1e6,
+    }
+
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def parse_grid(param_args):
+    """['spawn_interval=60,90', 'powerup_weights=[0.4,0.4,0.2];[0.2,0.2,0.6]'] -> list of param dicts.
+
+    Values are comma separated, or semicolon separated when a value itself
+    contains commas.
+    """
+    names, choices = [], []
+    for arg in param_args:
+        name, _, values = arg.partition("=")
+        if name not in game.Balance._fields:
+            raise SystemExit(f"Unknown parameter {name!r}; choose from {', '.join(game.Balance._fields)}")
+        separator = ";" if ";" in values or values.startswith("[") else ","
+        parsed = [parse_value(value) for value in values.split(separator)]
+        names.append(name)
+        choices.append([tuple(v) if isinstance(v, list) else v for v in parsed])
+    return [dict(zip(names, combo)) for combo in itertools.product(*choices)]
+
+def parse_seeds(text):
+    start, _, stop = text.partition(":")
+    return range(int(start), int(stop)) if stop else range(int(start), int(start) + 1)
+
+class ColumnWriter:
+    """Appends batches of run records to a JSON Lines file, one {column: values} object per batch."""
+    def __init__(self, path, batch_size=256):
+        self.file = open(path, "w")
+        self.batch_size = batch_size
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            columns = {name: [row[name] for row in self.rows] for name in self.rows[0]}
+            self.file.write(json.dumps(columns) + "\n")
+            self.file.flush()
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+def load_results(path):
+    """Read a results file back into one {column: values} dict."""
+    columns = {}
+    with open(path) as f:
+        for line in f:
+            for name, values in json.loads(line).items():
+                columns.setdefault(name, []).extend(values)
+    return columns
+
+def summarize(rows, names, budget_sprites, budget_ms):
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[name] for name in names), []).append(row)
+    for key, runs in groups.items():
+        label = ", ".join(f"{name}={value}" for name, value in zip(names, key)) or "defaults"
+        peak = np.percentile([run["peak_sprites"] for run in runs], 95)
+        cost = np.mean([run["mean_step_ms"] for run in runs])
+        flag = "" if peak <= budget_sprites and cost <= budget_ms else "  OVER BUDGET"
+        print(f"{label}: runs {len(runs)}, score {np.mean([run['score'] for run in runs]):.0f}, "
+              f"level {np.mean([run['level'] for run in runs]):.2f}, "
+              f"frames {np.mean([run['frames'] for run in runs]):.0f}, "
+              f"p95 peak sprites {peak:.0f}, step {cost:.3f} ms{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2",
+                        help="Balance field and the values to sweep (repeatable)")
+    parser.add_argument("--seeds", default="0:100", help="seed range START:STOP")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="sweeper")
+    parser.add_argument("--waves", metavar="PATH", help="wave file to play instead of the default schedule")
+    parser.add_argument("--max-frames", type=int, default=60 * 60 * 10, help="frame cap per game")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--output", default="simulation.jsonl", help="columnar JSON Lines results file")
+    parser.add_argument("--budget-sprites", type=int, default=300, help="p95 peak sprite count budget")
+    parser.add_argument("--budget-ms", type=float, default=4.0, help="mean step cost budget in ms")
+    args = parser.parse_args()
+
+    grid = parse_grid(args.param)
+    if args.waves:
+        try:
+            load_waves(args.waves)  # fail fast on a broken file, before starting the workers
+        except (OSError, ValueError) as e:
+            raise SystemExit(str(e))
+    seeds = parse_seeds(args.seeds)
+    jobs = [(params, seed) for params in grid for seed in seeds]
+    print(f"{len(jobs)} games ({len(grid)} parameter sets x {len(seeds)} seeds) on {args.workers} workers")
+
+    writer = ColumnWriter(args.output)
+    rows = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_game, params, seed, args.policy, args.max_frames, args.waves)
+                   for params, seed in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            writer.write(row)
+            rows.append(row)
+            if done % 100 == 0:
+                print(f"  {done}/{len(jobs)} games", file=sys.stderr)
+    writer.close()
+    elapsed = time.perf_counter() - start
+    frames = sum(row["frames"] for row in rows)
+    print(f"Simulated {frames} frames in {elapsed:.1f}s ({frames / elapsed:.0f} frames/s); results in {args.output}")
+    summarize(rows, [arg.partition("=")[0] for arg in args.param], args.budget_sprites, args.budget_ms)
+
+if __name__ == "__main__":
+    main()